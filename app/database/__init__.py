@@ -0,0 +1 @@
+"""Locality name database scripts. Run as modules from the app folder, e.g. `python -m database.reset_db`."""
@@ -2,9 +2,6 @@
 import sys
 from pathlib import Path
 
-# Add parent directory to path to import db_utils
-sys.path.insert(0, str(Path(__file__).parent.parent))
-
 from database.db_utils import get_db_connection, execute_sql_file
 
 
@@ -2,12 +2,8 @@
 import sys
 import csv
 from datetime import datetime
-from pathlib import Path
 import psycopg2.extras
 
-# Add parent directory to path to import db_utils
-sys.path.insert(0, str(Path(__file__).parent.parent))
-
 from database.db_utils import get_db_connection
 
 
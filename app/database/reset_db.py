@@ -1,10 +1,7 @@
 """Reset database by dropping and recreating tables."""
 import sys
 from pathlib import Path
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-
-# Add parent directory to path to import db_utils
-sys.path.insert(0, str(Path(__file__).parent.parent))
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, ISOLATION_LEVEL_DEFAULT
 
 from database.db_utils import get_db_connection, execute_sql_file
 
@@ -46,7 +43,8 @@ def main():
             print("Dropped extensions.")
         
         # Switch back to normal transaction mode for schema creation
-        conn.set_isolation_level(0)  # Default isolation level
+        # (0 would be ISOLATION_LEVEL_AUTOCOMMIT, not the default)
+        conn.set_isolation_level(ISOLATION_LEVEL_DEFAULT)
         
         # Recreate schema
         execute_sql_file(conn, schema_file)
@@ -1,11 +1,7 @@
 """Search for localities in the database using hybrid fuzzy matching."""
 import sys
-from pathlib import Path
 import time
 
-# Add parent directory to path to import db_utils
-sys.path.insert(0, str(Path(__file__).parent.parent))
-
 from database.db_utils import get_db_connection
 from Levenshtein import distance as levenshtein_distance
 
@@ -53,10 +49,13 @@ def main():
             
             # Step 2: Calculate Levenshtein distance for each candidate
             # Levenshtein distance: lower = better match (0 = exact match)
+            # pg_trgm similarity is already case-insensitive, so only the Python
+            # side needs folding; fold the search string once, not per row
+            search_folded = search_string.lower()
             results_with_levenshtein = []
             for row in candidates:
                 id_val, feature_class, name, source, updated, sim_score = row
-                lev_dist = levenshtein_distance(search_string.lower(), name.lower())
+                lev_dist = levenshtein_distance(search_folded, name.lower())
                 results_with_levenshtein.append({
                     'id': id_val,
                     'feature_class': feature_class,
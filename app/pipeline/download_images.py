@@ -78,6 +78,10 @@ FINBIF_BASE_URL = "https://api.laji.fi"
 FINBIF_UNIT_LIST_URL = f"{FINBIF_BASE_URL}/warehouse/query/unit/list"
 FINBIF_DOCUMENT_URL = f"{FINBIF_BASE_URL}/warehouse/query/document"
 
+# One session for the whole run, so TCP+TLS connections to FinBIF and the
+# image server are reused instead of reconnecting for every request.
+HTTP_SESSION = requests.Session()
+
 
 def validate_settings(settings: dict[str, Any]) -> dict[str, Any]:
     required = ["run_id", "image_folder_name", "search_url"]
@@ -147,7 +151,7 @@ def fetch_finbif_json(*, url: str, params: dict[str, Any] | None = None) -> dict
     token = os.getenv("FINBIF_ACCESS_TOKEN")
     if not token:
         raise ValueError("Set FINBIF_ACCESS_TOKEN in environment or .env")
-    resp = requests.get(
+    resp = HTTP_SESSION.get(
         url,
         params=params,
         headers={
@@ -171,7 +175,7 @@ def fetch_image_bytes(image_url: str) -> bytes | None:
 
     for attempt in range(1, total_attempts + 1):
         try:
-            resp = requests.get(
+            resp = HTTP_SESSION.get(
                 image_url,
                 headers=IMAGE_REQUEST_HEADERS,
                 timeout=60,
@@ -12,6 +12,7 @@ from cache_utils import (
     save_consolidation_cache
 )
 from rag_utils import get_rag_content
+from semantic_cache import SemanticCache
 
 
 def post_process_consolidation(text_content: str) -> str:
@@ -43,6 +44,10 @@ debug = False
 # True = Vertex AI Express Mode (GEMINI_VERTEX_API_KEY). False = Gemini Developer API (GEMINI_DEVELOPER_API_KEY).
 USE_VERTEX_AI = True
 
+# Reuse the consolidation of a near-identical earlier specimen instead of calling the model.
+# Off by default: specimens that differ only in a date or number can still look identical.
+USE_SEMANTIC_CACHE = False
+
 system_prompt = """
 Your task is to consolidate and refine multiple raw transcripts into a single, coherent set of label text for one biological specimen. 
 
@@ -63,6 +68,7 @@ In your final response, write "Consolidation:" followed only by your consolidate
 
 # Initialize the Gemini client
 client = get_gemini_client(use_vertex_ai=USE_VERTEX_AI)
+semantic_cache = SemanticCache(client) if USE_SEMANTIC_CACHE else None
 
 #print(f"System prompt: {system_prompt}")
 print(f"Temperature: {temperature}")
@@ -160,7 +166,8 @@ for folder_name in folder_names:
             text_content=transcripts_content, # TODO: test with all_content
             model_name=model_name,
             system_prompt=system_prompt,
-            temperature=temperature
+            temperature=temperature,
+            semantic_cache=semantic_cache
         )
 
         processed_consolidation_text = post_process_consolidation(consolidation_text)
@@ -3,10 +3,10 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parent.parent / "utils"))
 
-from image_utils import collect_image_files_from_folders, load_image_as_part, get_subfolders
-from gemini_utils import get_gemini_client, generate_transcription_with_stream_capture
+from image_utils import collect_image_files_from_folders, get_subfolders
+from gemini_utils import get_gemini_client, transcribe_batch
 from cache_utils import cache_exists, load_cache, save_cache
-import hashlib
+import asyncio
 import json
 from datetime import datetime
 
@@ -35,6 +35,50 @@ def save_raw_gemini_response(cache_path, response_payload: dict) -> str:
         )
     return str(raw_response_path)
 
+def save_transcription(image_file, response_payload: dict | Exception) -> None:
+    """
+    Post-process and cache one transcription result as soon as it arrives.
+    """
+    print(f"\nProcessing: {image_file}")
+    
+    try:
+        if isinstance(response_payload, Exception):
+            raise response_payload
+        response_text = response_payload["transcript_text"]
+
+        # Don't cache an empty transcript caused by the token cap, so the
+        # image is retried on the next run
+        if not response_text.strip() and response_payload.get("finish_reason") == "MAX_TOKENS":
+            print("Warning: no text before max_output_tokens was reached, not saving to cache")
+            print("-" * 50)
+            return
+
+        processed_response_text = post_process_transcript(response_text)
+        
+        # Save to cache
+        cache_path = save_cache(
+            image_file=image_file,
+            raw_transcript=response_text,
+            transcript=processed_response_text,
+            model_name=model_name,
+            prompt=system_prompt,
+            temperature=temperature,
+            run_version=run_version
+        )
+        print(f"Saved to cache: {cache_path}")
+
+        raw_response_path = save_raw_gemini_response(cache_path, response_payload)
+        print(f"Saved raw Gemini stream response: {raw_response_path}")
+        
+        # Print the response
+        print("Response:")
+        print(response_text)
+        print("-" * 50)
+        
+    except Exception as e:
+        print(f"Error processing {image_file.name}: {e}")
+        print("-" * 50)
+
 # Configuration
 # List of folder names to process
 folder_names = [
@@ -50,6 +94,8 @@ model_name = "gemini-3.1-pro-preview"
 temperature = 0.0
 run_version = "solanaceae2"
 max_chars = 1000
+# Number of images transcribed concurrently
+max_concurrency = 8
 
 # True = Vertex AI Express Mode (API key from Google Cloud). False = Gemini Developer API (aistudio.google.com).
 USE_VERTEX_AI = True
@@ -75,7 +121,8 @@ print(f"Model: {model_name}")
 print(f"Total images to process: {len(all_image_files)}")
 print("-" * 50)
 
-# Process each image
+# Report cached images; collect the rest for concurrent transcription
+uncached_files = []
 for image_file in all_image_files:
     print(f"\nProcessing: {image_file}")
     
@@ -85,44 +132,30 @@ for image_file in all_image_files:
             print("Cache found, skipping transcription...")
             cached = load_cache(image_file, run_version)
             response_text = cached["data"]["raw_transcript"]
-        else:
-            print("No cache found, doing transcription...")
-            # Load image and create part using helper function
-            image_part = load_image_as_part(image_file)
-            
-            # Generate transcription using Gemini API
-            response_payload = generate_transcription_with_stream_capture(
-                client=client,
-                image_part=image_part,
-                model_name=model_name,
-                system_prompt=system_prompt,
-                temperature=temperature,
-                max_chars=max_chars
-            )
-            response_text = response_payload["transcript_text"]
-
-            processed_response_text = post_process_transcript(response_text)
             
-            # Save to cache
-            cache_path = save_cache(
-                image_file=image_file,
-                raw_transcript=response_text,
-                transcript=processed_response_text,
-                model_name=model_name,
-                prompt=system_prompt,
-                temperature=temperature,
-                run_version=run_version
-            )
-            print(f"Saved to cache: {cache_path}")
-
-            raw_response_path = save_raw_gemini_response(cache_path, response_payload)
-            print(f"Saved raw Gemini stream response: {raw_response_path}")
-        
-        # Print the response
-        print("Response:")
-        print(response_text)
-        print("-" * 50)
+            # Print the response
+            print("Response:")
+            print(response_text)
+            print("-" * 50)
+        else:
+            print("No cache found, queued for transcription...")
+            uncached_files.append(image_file)
         
     except Exception as e:
         print(f"Error processing {image_file.name}: {e}")
         print("-" * 50)
+
+# Generate transcriptions using Gemini API, several requests in flight at a time.
+# Each result is saved as soon as it arrives, so an interrupted run keeps
+# everything transcribed so far.
+print(f"\nTranscribing {len(uncached_files)} image(s), up to {max_concurrency} concurrently...")
+asyncio.run(transcribe_batch(
+    client=client,
+    image_files=uncached_files,
+    model_name=model_name,
+    system_prompt=system_prompt,
+    temperature=temperature,
+    max_chars=max_chars,
+    max_concurrency=max_concurrency,
+    on_result=lambda index, response_payload: save_transcription(uncached_files[index], response_payload)
+))
@@ -8,10 +8,15 @@ See FinBIF_API.md for API details.
 import json
 import os
 import sys
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 
 import requests
 
+sys.path.append(str(Path(__file__).resolve().parent.parent / "utils"))
+
+from http_utils import RateLimiter, create_session
+
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -20,6 +25,12 @@ except ImportError:
 
 IMAGES_DIR = "../images-solanaceae"
 
+# Image downloads run in parallel, but the overall request rate to the image
+# server is still capped to stay polite.
+MAX_IMAGE_WORKERS = 8
+IMAGE_REQUESTS_PER_SECOND = 4
+IMAGE_CHUNK_SIZE = 64 * 1024
+
 # Browser-like User-Agent for image requests (some servers block scripts)
 IMAGE_REQUEST_HEADERS = {
     "User-Agent": os.getenv("USER_AGENT", "UserAgentString")
@@ -74,34 +85,114 @@ def fetch_finbif(url: str) -> dict:
     return resp.json()
 
 
+def download_image(
+    session: requests.Session,
+    limiter: RateLimiter,
+    doc_id: str,
+    img_url: str,
+    img_path: str,
+    filename: str,
+) -> None:
+    """Download one image to img_path; print response details and raise on failure."""
+    limiter.acquire()
+    print(f"  {doc_id}: fetching {img_url}")
+    # Stream to disk so only one chunk per download is held in memory
+    with session.get(img_url, headers=IMAGE_REQUEST_HEADERS, timeout=30, stream=True) as resp:
+        if not resp.ok:
+            print("  Image fetch failed — response details:", file=sys.stderr)
+            print(f"    status: {resp.status_code}", file=sys.stderr)
+            print(f"    final URL: {resp.url}", file=sys.stderr)
+            print(f"    response headers: {dict(resp.headers)}", file=sys.stderr)
+            body_preview = resp.raw.read(500) or b""
+            print(f"    body preview ({len(body_preview)} bytes): {body_preview!r}", file=sys.stderr)
+            resp.raise_for_status()
+        with open(img_path, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=IMAGE_CHUNK_SIZE):
+                f.write(chunk)
+    print(f"    {filename}")
+
+
+def group_units_by_document(list_items: list[dict]) -> dict[str, dict]:
+    """
+    Reshape unit list rows into document-shaped specimens, keyed by documentId.
+
+    The list endpoint returns one flat row per unit ({document, gathering, unit}).
+    Units are appended to their gathering (matched by gatheringId) within their
+    document, so the result matches the document.gatherings[].units[].media[]
+    shape of a single-document fetch that iter_specimen_images expects.
+    """
+    specimens: dict[str, dict] = {}
+    # (documentId, gatheringId) -> gathering dict already added to its document
+    gatherings_by_id: dict[tuple[str, str], dict] = {}
+    for item in list_items:
+        document = item.get("document", {})
+        doc_id = document["documentId"]
+        specimen = specimens.setdefault(doc_id, {"document": {**document, "gatherings": []}})
+        row_gathering = item.get("gathering", {})
+        gathering_id = row_gathering.get("gatheringId")
+        gathering = gatherings_by_id.get((doc_id, gathering_id)) if gathering_id else None
+        if gathering is None:
+            gathering = {**row_gathering, "units": []}
+            specimen["document"]["gatherings"].append(gathering)
+            if gathering_id:
+                gatherings_by_id[(doc_id, gathering_id)] = gathering
+        gathering["units"].append(item.get("unit", {}))
+    return specimens
+
+
 def main():
 
     SKIP_DIGITARIUM_IMAGES = False
     order_by = "&orderBy=RANDOM:42"
 
-    page_size = 100
-    url = f"https://api.laji.fi/warehouse/query/unit/list?pageSize={page_size}&page=1&cache=false&collectionId=HR.168&recordBasis=PRESERVED_SPECIMEN&hasUnitMedia=true{order_by}"
+    # Project the fields we need (including unit media) in the list call itself,
+    # so we don't need a separate single-document request per specimen.
+    # Keep this in sync with the readers of document.json (e.g. compare.py
+    # reads taxonVerbatim, higherGeography, country and displayDateTime).
+    selected = ",".join([
+        "document.collectionId",
+        "document.documentId",
+        "document.licenseId",
+        "document.secureLevel",
+        "document.secureReasons",
+        "document.sourceId",
+        "gathering.conversions.wgs84CenterPoint.lat",
+        "gathering.conversions.wgs84CenterPoint.lon",
+        "gathering.country",
+        "gathering.displayDateTime",
+        "gathering.gatheringId",
+        "gathering.higherGeography",
+        "gathering.interpretations.coordinateAccuracy",
+        "gathering.interpretations.municipalityDisplayname",
+        "gathering.interpretations.sourceOfCoordinates",
+        "gathering.locality",
+        "gathering.team",
+        "unit.abundanceString",
+        "unit.linkings.taxon.id",
+        "unit.linkings.taxon.qname",
+        "unit.linkings.taxon.scientificName",
+        "unit.linkings.taxon.vernacularName",
+        "unit.media",
+        "unit.notes",
+        "unit.recordBasis",
+        "unit.taxonVerbatim",
+        "unit.unitId",
+    ])
 
-#    url = f"https://api.laji.fi/warehouse/query/unit/list?pageSize={page_size}&page=1&cache=false&collectionId=HR.168&recordBasis=PRESERVED_SPECIMEN&hasUnitMedia=true&selected=document.collectionId,document.documentId,document.licenseId,document.secureLevel,document.secureReasons,document.sourceId,gathering.conversions.wgs84CenterPoint.lat,gathering.conversions.wgs84CenterPoint.lon,gathering.displayDateTime,gathering.gatheringId,gathering.interpretations.coordinateAccuracy,gathering.interpretations.municipalityDisplayname,gathering.interpretations.sourceOfCoordinates,gathering.locality,gathering.team,unit.abundanceString,unit.linkings.taxon.id,unit.linkings.taxon.qname,unit.linkings.taxon.scientificName,unit.linkings.taxon.vernacularName,unit.notes,unit.recordBasis,unit.taxonVerbatim,unit.unitId"
-    
+    page_size = 100
+    url = f"https://api.laji.fi/warehouse/query/unit/list?pageSize={page_size}&page=1&cache=false&collectionId=HR.168&recordBasis=PRESERVED_SPECIMEN&hasUnitMedia=true&selected={selected}{order_by}"
 
     print(url)
     specimen_data = fetch_finbif(url)
 
-    specimens = specimen_data.get("results", [])
+    specimens = group_units_by_document(specimen_data.get("results", []))
 
     print(f"Found {len(specimens)} specimen(s)\n")
 
-    for i, list_item in enumerate(specimens, 1):
+    # (doc_id, img_url, img_path, filename) for every image to download
+    downloads: list[tuple[str, str, str, str]] = []
 
-        doc_id = list_item["document"]["documentId"]
-        single_specimen_url = f"https://api.laji.fi/warehouse/query/single?documentId={doc_id}"
-        single_specimen_data = fetch_finbif(single_specimen_url)
-        specimen = (
-            single_specimen_data
-            if "document" in single_specimen_data
-            else single_specimen_data.get("results", [{}])[0]
-        )
+    for doc_id, specimen in specimens.items():
 
         if SKIP_DIGITARIUM_IMAGES:
             first_url = first_image_url(specimen)
@@ -119,24 +210,24 @@ def main():
         print(f"  {dir_name}: saved {doc_path}")
 
         for media, filename in iter_specimen_images(specimen):
-            time.sleep(1)
-            img_url = media["fullURL"]
-            print(f"  {doc_id}: fetching {img_url}")
-
             img_path = os.path.join(out_dir, filename)
-            resp = requests.get(img_url, headers=IMAGE_REQUEST_HEADERS, timeout=30)
-            if not resp.ok:
-                print("  Image fetch failed — response details:", file=sys.stderr)
-                print(f"    status: {resp.status_code}", file=sys.stderr)
-                print(f"    final URL: {resp.url}", file=sys.stderr)
-                print(f"    response headers: {dict(resp.headers)}", file=sys.stderr)
-                body_preview = resp.content[:500] if resp.content else b""
-                print(f"    body preview ({len(body_preview)} bytes): {body_preview!r}", file=sys.stderr)
-                resp.raise_for_status()
-            with open(img_path, "wb") as f:
-                f.write(resp.content)
-            print(f"    {filename}")
-
+            downloads.append((doc_id, media["fullURL"], img_path, filename))
+
+    session = create_session(pool_connections=2, pool_maxsize=MAX_IMAGE_WORKERS)
+    limiter = RateLimiter(IMAGE_REQUESTS_PER_SECOND)
+    with ThreadPoolExecutor(max_workers=MAX_IMAGE_WORKERS) as executor:
+        futures = [
+            executor.submit(download_image, session, limiter, doc_id, img_url, img_path, filename)
+            for doc_id, img_url, img_path, filename in downloads
+        ]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except Exception:
+            # Stop the run on the first failed fetch: drop the queued downloads
+            # instead of letting the executor finish them before re-raising
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
 
 if __name__ == "__main__":
     main()
@@ -7,7 +7,7 @@ Requirements:
 
 This script reads consolidation data from JSON files in specified folders and
 sends the consolidation text to the Google Geocoding API. Results are cached
-in a shelve DB to avoid repeated queries. Output TSV is saved to ./app/output
+in a SQLite DB to avoid repeated queries. Output TSV is saved to ./app/output
 with a datetime in the filename.
 """
 import sys
@@ -18,13 +18,22 @@ sys.path.append(str(Path(__file__).resolve().parent.parent / "utils"))
 
 import os
 import csv
-import shelve
-import time
+import queue
+import re
+import sqlite3
+import threading
 import json
-from urllib.parse import quote_plus
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-import requests
+from urllib3.util.retry import Retry
 from cache_utils import load_consolidation_cache
+from http_utils import TokenBucket, create_session
+
+# orjson parses API responses several times faster; fall back to the standard library
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 # Configuration
 # List of folder names to process. Each contain images from a single specimen.
@@ -57,45 +66,174 @@ branch_version = "" # Set to empty string to use just run_version, or e.g. "b" f
 
 DATA_SOURCE = "gt"  # Options: "consolidation" or "gt"
 
+# Set GEOCODE_DEBUG=1 to print the full JSON response of every API request
+GEOCODE_DEBUG = os.getenv("GEOCODE_DEBUG") == "1"
+
 OUTPUT_DIR = Path("output")
-CACHE_DB = OUTPUT_DIR / "google_geocode_cache_v2.db"
+CACHE_DB = OUTPUT_DIR / "google_geocode_cache.sqlite"
+
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+TSV_BUFFER_SIZE = 1 << 20
+
+# Output rows are plain tuples in this column order
+FIELDNAMES = ["folder", "text", "lat", "lon", "formatted_address", "types", "status", "selected"]
+
+# Concurrency and rate limiting, shared by all worker threads
+MAX_WORKERS = 10
+REQUESTS_PER_SECOND = 10
+# Up to this many requests may go out at once after an idle period
+REQUEST_BURST = 10
+rate_limiter = TokenBucket(rate=REQUESTS_PER_SECOND, capacity=REQUEST_BURST)
+
+# One pooled session for all requests, so TCP+TLS connections are reused
+session = create_session(
+    pool_connections=1,
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        # Return the last response instead of raising, so it is handled as before
+        raise_on_status=False
+    )
+)
+
+# Only definitive answers are cached; OVER_QUERY_LIMIT, UNKNOWN_ERROR, invalid
+# JSON etc. are transient and should be retried on the next run.
+CACHEABLE_STATUSES = frozenset({"OK", "ZERO_RESULTS", "INVALID_REQUEST"})
+
+# Used by preprocess_text: newline variants, and the start of a line up to a
+# museum name such as "Mus. Zool. H:fors" or "Museum"
+_NEWLINE_RE = re.compile(r'\r\n?')
+_MUSEUM_LINE_RE = re.compile(r'^.*?(?:mus\.|muse)', re.IGNORECASE | re.MULTILINE)
+
+# In-process cache in front of the SQLite DB: repeated tokens within a run
+# are answered without a disk read.
+_memory_cache = {}
+
+
+class GeocodeCache:
+    """Geocode results stored as JSON in a single SQLite table, keyed by token."""
+
+    def __init__(self, path):
+        # Autocommit mode; writes are grouped explicitly with `with self.conn:`
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS geocode_cache (token TEXT PRIMARY KEY, json TEXT)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, token):
+        """Return the cached result for token, or None."""
+        row = self.conn.execute("SELECT json FROM geocode_cache WHERE token = ?", (token,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, items):
+        """Store (token, result) pairs in one transaction."""
+        rows = [(token, json.dumps(out, ensure_ascii=False)) for token, out in items]
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("INSERT OR REPLACE INTO geocode_cache (token, json) VALUES (?, ?)", rows)
+
+    def close(self):
+        self.conn.close()
+
+
+def get_cached_result(token, cache):
+    """Return the cached geocode result for a token, or None if it must be queried."""
+    # Nothing to geocode: skip the cache lookups, rate limiter and API call
+    if not token or not token.strip():
+        return {"status": "ZERO_RESULTS", "results": []}
+
+    # Geocoding is case-insensitive, so e.g. "Helsinki " and "helsinki" share an entry
+    cache_key = token.strip().lower()
+
+    if cache_key in _memory_cache:
+        return _memory_cache[cache_key]
+
+    out = cache.get(cache_key)
+    if out is not None:
+        _memory_cache[cache_key] = out
+    return out
 
-# rate limiting
-last_query_time = 0.0
-MIN_DELAY = 1.0  # seconds between requests
 
-def geocode_token(token, cache, api_key):
-    """Return a dict with geocode result or None. Cached by token."""
-    if token in cache:
-        return cache[token]
+class CacheWriter:
+    """
+    Background thread that writes new geocode results to the cache DB.
 
-    global last_query_time
-    # enforce basic rate limit
-    elapsed = time.time() - last_query_time
-    if elapsed < MIN_DELAY:
-        time.sleep(MIN_DELAY - elapsed)
+    Workers put() results as soon as their request finishes, so cache writes
+    overlap with the requests still in flight. The thread uses its own SQLite
+    connection and writes whatever has queued up in one transaction.
+    """
 
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?address={quote_plus(token)}&key={api_key}"
-    resp = requests.get(url, timeout=10)
-    last_query_time = time.time()
+    _STOP = object()
+
+    def __init__(self, path):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, args=(path,), daemon=True)
+        self._thread.start()
+
+    def put(self, token, out):
+        """Queue a (token, result) pair for writing."""
+        self._queue.put((token, out))
+
+    def close(self):
+        """Write everything still queued and stop the thread."""
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def _run(self, path):
+        with GeocodeCache(path) as cache:
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                while not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                stopping = self._STOP in batch
+                entries = [item for item in batch if item is not self._STOP]
+                if entries:
+                    cache.update(entries)
+
+
+def fetch_result(token, cache_writer):
+    """Query the API for a token in a worker thread and queue a definitive result for caching."""
+    out = query_geocode_api(token.strip(), api_key)
+    if out.get("status") in CACHEABLE_STATUSES:
+        cache_key = token.strip().lower()
+        _memory_cache[cache_key] = out
+        cache_writer.put(cache_key, out)
+    return out
+
+
+def query_geocode_api(token, api_key):
+    """Query the Google Geocoding API for a token and return a trimmed result dict."""
+    rate_limiter.acquire()
+
+    resp = session.get(GEOCODE_URL, params={"address": token, "key": api_key}, timeout=10)
 
     try:
-        data = resp.json()
-        # Print full API response to terminal
-        print("\n" + "=" * 50)
-        print(f"Full API response for token: '{token}'")
-        print("=" * 50)
-        print(json.dumps(data, indent=2, ensure_ascii=False))
-        print("=" * 50 + "\n")
+        data = json_loads(resp.content)
+        if GEOCODE_DEBUG:
+            # Print full API response to terminal, in one write so threads don't interleave
+            divider = "=" * 50
+            print(
+                f"\n{divider}\nFull API response for token: '{token}'\n{divider}\n"
+                f"{json.dumps(data, indent=2, ensure_ascii=False)}\n{divider}\n"
+            )
     except Exception as e:
         print(f"Error parsing JSON response for token '{token}': {e}")
-        cache[token] = {"status": "error", "error": f"invalid json: {e}"}
-        return cache[token]
+        return {"status": "error", "error": f"invalid json: {e}"}
 
     status = data.get("status")
     if status != "OK":
-        cache[token] = {"status": status, "results": []}
-        return cache[token]
+        return {"status": status, "results": []}
 
     results = []
     for r in data.get("results", []):
@@ -106,12 +244,9 @@ def geocode_token(token, cache, api_key):
             "lat": loc.get("lat"),
             "lon": loc.get("lng"),
             "types": r.get("types", []),
-            "raw": r,
         })
 
-    out = {"status": status, "results": results}
-    cache[token] = out
-    return out
+    return {"status": status, "results": results}
 
 
 def preprocess_text(text):
@@ -130,25 +265,116 @@ def preprocess_text(text):
         return text
     
     # Normalize newlines to \n for processing
-    text_normalized = text.replace('\r\n', '\n').replace('\r', '\n')
-    
-    # Split into lines
-    lines = text_normalized.split('\n')
+    text_normalized = _NEWLINE_RE.sub('\n', text)
     
-    # Find the first line containing "mus." or "muse" (case insensitive)
-    filtered_lines = []
-    for line in lines:
-        line_lower = line.lower()
-        if 'mus.' in line_lower or 'muse' in line_lower:
-            # Stop at this line (don't include it or any after)
-            break
-        filtered_lines.append(line)
-    
-    # Join back with newlines
-    text_filtered = '\n'.join(filtered_lines)
+    # Cut at the start of the first line containing "mus." or "muse"
+    # (don't include it or any after), dropping the newline before it
+    match = _MUSEUM_LINE_RE.search(text_normalized)
+    if match:
+        text_normalized = text_normalized[:max(match.start() - 1, 0)]
     
     # Replace newlines with comma and space
-    return text_filtered.replace('\n', ', ')
+    return text_normalized.replace('\n', ', ')
+
+
+def empty_row(folder_name, status, text=""):
+    """Return an output row for a folder without a geocode result."""
+    return (folder_name, text, "", "", "", "", status, False)
+
+
+def load_folder_text(folder_name):
+    """
+    Load and preprocess the text to geocode for one folder.
+
+    Returns:
+        (text, None) on success, or (None, row) with the TSV row to write when
+        there is nothing to geocode
+    """
+    print(f"\nProcessing {folder_name}...")
+    base_folder = Path(folder_name)
+
+    # Load data based on DATA_SOURCE
+    if DATA_SOURCE == "consolidation":
+        # Load consolidation data
+        try:
+            cache_data = load_consolidation_cache(base_folder, consolidation_version)
+            text_to_geocode = cache_data["data"]["consolidation"]
+        except FileNotFoundError:
+            print(f"Warning: Consolidation cache not found for run_{consolidation_version}, skipping...")
+            return None, empty_row(folder_name, "consolidation_not_found")
+        except Exception as e:
+            print(f"Error loading consolidation for {folder_name}: {e}")
+            return None, empty_row(folder_name, f"error_loading: {e}")
+    else:  # DATA_SOURCE == "gt"
+        # Load gt.txt file
+        gt_path = base_folder / "gt.txt"
+        try:
+            text_to_geocode = gt_path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            print(f"Warning: {gt_path} not found, skipping...")
+            return None, empty_row(folder_name, "gt_file_not_found")
+        except Exception as e:
+            print(f"Error loading gt.txt for {folder_name}: {e}")
+            return None, empty_row(folder_name, f"error_loading_gt: {e}")
+
+    if not text_to_geocode or not text_to_geocode.strip():
+        status_msg = "empty_consolidation" if DATA_SOURCE == "consolidation" else "empty_gt"
+        return None, empty_row(folder_name, status_msg)
+
+    # Preprocess text before geocoding
+    return preprocess_text(text_to_geocode), None
+
+
+def build_row(folder_name, text_to_geocode, res):
+    """Build the output TSV row for a folder from its geocode result."""
+    if not res:
+        return empty_row(folder_name, "no_result", text_to_geocode)
+
+    status = res.get("status")
+    if status == "OK" and res.get("results"):
+        first = res["results"][0]
+        return (
+            folder_name,
+            text_to_geocode,
+            first.get("lat"),
+            first.get("lon"),
+            first.get("formatted_address"),
+            ";".join(first.get("types", [])),
+            status,
+            True,
+        )
+    else:
+        return empty_row(folder_name, status, text_to_geocode)
+
+
+def geocode_texts(texts, cache, cache_writer, executor):
+    """
+    Geocode each distinct text once and return a dict of text -> result.
+
+    texts may be a generator that yields texts as folders finish loading;
+    API requests for cache misses are submitted to the executor right away,
+    so they overlap with the remaining reads. Cache lookups happen here in the
+    calling thread; new results are written by cache_writer.
+    """
+    results = {}
+    pending = {}
+    for text in texts:
+        if text in results or text in pending:
+            continue
+        out = get_cached_result(text, cache)
+        if out is None:
+            pending[text] = executor.submit(fetch_result, text, cache_writer)
+        else:
+            results[text] = out
+
+    for text, future in pending.items():
+        results[text] = future.result()
+
+    for text, res in results.items():
+        print("Geocoding text:", text)
+        print("Geocode result status:", res.get("status"))
+        print("Number of results:", len(res.get("results", [])) if res else 0)
+    return results
 
 
 api_key = os.getenv('GOOGLE_API_KEY')
@@ -187,140 +413,40 @@ if DATA_SOURCE == "consolidation":
 print(f"Output file: {OUT_TSV}")
 print("=" * 50)
 
-with shelve.open(str(CACHE_DB)) as cache, open(OUT_TSV, "w", newline="", encoding="utf-8") as fout:
-    fieldnames = ["folder", "text", "lat", "lon", "formatted_address", "types", "status", "selected"]
-    writer = csv.DictWriter(fout, fieldnames=fieldnames, delimiter="\t", quoting=csv.QUOTE_MINIMAL)
-    writer.writeheader()
-
-    for folder_name in folder_names:
-        print(f"\nProcessing {folder_name}...")
-        base_folder = Path(folder_name)
-        
-        # Load data based on DATA_SOURCE
-        if DATA_SOURCE == "consolidation":
-            # Load consolidation data
-            try:
-                cache_data = load_consolidation_cache(base_folder, consolidation_version)
-                text_to_geocode = cache_data["data"]["consolidation"]
-            except FileNotFoundError:
-                print(f"Warning: Consolidation cache not found for run_{consolidation_version}, skipping...")
-                writer.writerow({
-                    "folder": folder_name,
-                    "text": "",
-                    "lat": "",
-                    "lon": "",
-                    "formatted_address": "",
-                    "types": "",
-                    "status": "consolidation_not_found",
-                    "selected": False
-                })
-                continue
-            except Exception as e:
-                print(f"Error loading consolidation for {folder_name}: {e}")
-                writer.writerow({
-                    "folder": folder_name,
-                    "text": "",
-                    "lat": "",
-                    "lon": "",
-                    "formatted_address": "",
-                    "types": "",
-                    "status": f"error_loading: {e}",
-                    "selected": False
-                })
-                continue
-        else:  # DATA_SOURCE == "gt"
-            # Load gt.txt file
-            gt_path = base_folder / "gt.txt"
-            try:
-                if not gt_path.exists():
-                    print(f"Warning: {gt_path} not found, skipping...")
-                    writer.writerow({
-                        "folder": folder_name,
-                        "text": "",
-                        "lat": "",
-                        "lon": "",
-                        "formatted_address": "",
-                        "types": "",
-                        "status": "gt_file_not_found",
-                        "selected": False
-                    })
-                    continue
-                with open(gt_path, 'r', encoding='utf-8') as f:
-                    text_to_geocode = f.read()
-            except Exception as e:
-                print(f"Error loading gt.txt for {folder_name}: {e}")
-                writer.writerow({
-                    "folder": folder_name,
-                    "text": "",
-                    "lat": "",
-                    "lon": "",
-                    "formatted_address": "",
-                    "types": "",
-                    "status": f"error_loading_gt: {e}",
-                    "selected": False
-                })
-                continue
-
-        if not text_to_geocode or not text_to_geocode.strip():
-            status_msg = "empty_consolidation" if DATA_SOURCE == "consolidation" else "empty_gt"
-            writer.writerow({
-                "folder": folder_name,
-                "text": "",
-                "lat": "",
-                "lon": "",
-                "formatted_address": "",
-                "types": "",
-                "status": status_msg,
-                "selected": False
-            })
-            continue
-
-        # Preprocess text before geocoding
-        text_to_geocode = preprocess_text(text_to_geocode)
-
-        print("Geocoding text:", text_to_geocode)
-
-        res = geocode_token(text_to_geocode, cache, api_key)
-
-        print("Geocode result status:", res.get("status"))
-        print("Number of results:", len(res.get("results", [])) if res else 0)
-
-        if not res:
-            writer.writerow({
-                "folder": folder_name,
-                "text": text_to_geocode,
-                "lat": "",
-                "lon": "",
-                "formatted_address": "",
-                "types": "",
-                "status": "no_result",
-                "selected": False
-            })
-            continue
-
-        status = res.get("status")
-        if status == "OK" and res.get("results"):
-            first = res["results"][0]
-            writer.writerow({
-                "folder": folder_name,
-                "text": text_to_geocode,
-                "lat": first.get("lat"),
-                "lon": first.get("lon"),
-                "formatted_address": first.get("formatted_address"),
-                "types": ";".join(first.get("types", [])),
-                "status": status,
-                "selected": True,
-            })
-        else:
-            writer.writerow({
-                "folder": folder_name,
-                "text": text_to_geocode,
-                "lat": "",
-                "lon": "",
-                "formatted_address": "",
-                "types": "",
-                "status": status,
-                "selected": False
-            })
+# Large write buffer so rows reach the file in a few big writes rather than per row
+with GeocodeCache(CACHE_DB) as cache, open(OUT_TSV, "w", newline="", encoding="utf-8", buffering=TSV_BUFFER_SIZE) as fout:
+    writer = csv.writer(fout, delimiter="\t", quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(FIELDNAMES)
+
+    # Folders are read and geocoded concurrently; the shared TokenBucket keeps the
+    # overall request rate within quota. All reads are submitted up front.
+    cache_writer = CacheWriter(CACHE_DB)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        load_futures = [executor.submit(load_folder_text, folder_name) for folder_name in folder_names]
+
+        def loaded_texts():
+            """Yield texts in the order their reads finish."""
+            for future in as_completed(load_futures):
+                text_to_geocode, _ = future.result()
+                if text_to_geocode is not None:
+                    yield text_to_geocode
+
+        # Specimens from the same locality often share their text; geocode
+        # each distinct text once and fan the result out to its folders
+        try:
+            results = geocode_texts(loaded_texts(), cache, cache_writer, executor)
+        finally:
+            cache_writer.close()
+        loaded = [future.result() for future in load_futures]
+
+    rows = [
+        row if text_to_geocode is None else build_row(folder_name, text_to_geocode, results[text_to_geocode])
+        for folder_name, (text_to_geocode, row) in zip(folder_names, loaded)
+    ]
+    writer.writerows(rows)
+
+    # Make sure the results are on disk before reporting success
+    fout.flush()
+    os.fsync(fout.fileno())
 
 print(f"\nDone. Results written to {OUT_TSV}. Cached responses in {CACHE_DB}.")
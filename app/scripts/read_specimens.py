@@ -2,11 +2,18 @@
 
 import csv
 import json
+import os
+import sys
 import time
 from pathlib import Path
 from urllib.parse import urlparse
 
 import requests
+from urllib3.util.retry import Retry
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "utils"))
+
+from http_utils import create_session
 
 API_SUFFIX = "?format=json"
 LIMIT = 100000
@@ -38,6 +45,13 @@ def main() -> None:
     if not input_path.exists():
         raise FileNotFoundError(f"Input file not found: {input_path}")
 
+    # One session for all records, so TCP+TLS connections are reused
+    session = create_session(
+        pool_connections=2,
+        pool_maxsize=2,
+        max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    )
+
     with input_path.open("r", encoding="utf-8", newline="") as f:
         reader = csv.reader(f, delimiter="\t")
 
@@ -76,7 +90,7 @@ def main() -> None:
 
             api_url = f"{parent_event_id}{API_SUFFIX}"
             try:
-                response = requests.get(api_url, timeout=30)
+                response = session.get(api_url, timeout=30)
                 response.raise_for_status()
                 data = response.json()
             except (requests.RequestException, ValueError) as exc:
@@ -97,7 +111,7 @@ def main() -> None:
 
             try:
                 time.sleep(SLEEP_TIME)
-                image_response = requests.get(
+                image_response = session.get(
                     image_url,
                     headers=IMAGE_REQUEST_HEADERS,
                     timeout=60,
@@ -6,9 +6,23 @@ sys.path.append(str(Path(__file__).resolve().parent.parent / "utils"))
 # Script that verifies transcript data against ground truth
 
 from cache_utils import load_consolidation_cache, load_alignment_cache
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+import os
+import re
 import unicodedata
 
+# python-Levenshtein (bit-parallel C++) is much faster than the pure-Python fallbacks below
+try:
+    from Levenshtein import distance as _c_levenshtein_distance
+    from Levenshtein import editops as _c_editops
+except ImportError:
+    _c_levenshtein_distance = None
+    _c_editops = None
+
 
 # Configuration
 # Set to "consolidation" or "alignment" to test the corresponding data type
@@ -30,9 +44,31 @@ def normalize_text(text: str) -> str:
     return ''.join(text.split()).lower()
 
 
+class _AlphanumericTable(dict):
+    """
+    str.translate table that deletes everything except letters and numbers.
+
+    Filled lazily: unicodedata.category() runs once per distinct code point
+    seen during the run instead of once per character of every text.
+    """
+
+    def __missing__(self, code_point: int) -> int | None:
+        keep = unicodedata.category(chr(code_point)).startswith(('L', 'N'))
+        value = code_point if keep else None
+        self[code_point] = value
+        return value
+
+
+_ALPHANUMERIC_TABLE = _AlphanumericTable()
+
+# Runs of anything but letters and numbers. For str patterns \w is exactly the
+# Unicode L* and N* categories plus "_", so this matches the category test above.
+_NON_ALPHANUMERIC_RE = re.compile(r"[\W_]+")
+
+
 def filter_alphanumeric(text: str) -> str:
     """Keep only letters and numbers, including those with diacritics."""
-    return ''.join(c for c in text if unicodedata.category(c).startswith(('L', 'N')))
+    return text.translate(_ALPHANUMERIC_TABLE)
 
 
 def count_characters(text: str) -> Counter:
@@ -40,6 +76,14 @@ def count_characters(text: str) -> Counter:
     return Counter(text)
 
 
+def filter_alphanumeric_counts(char_counts: Counter) -> Counter:
+    """Keep only the counts of letters and numbers, including those with diacritics."""
+    return Counter({
+        c: count for c, count in char_counts.items()
+        if _ALPHANUMERIC_TABLE[ord(c)] is not None
+    })
+
+
 def compare_texts(gt_text: str, consolidation_text: str, alphanumeric_only: bool = False) -> tuple[float, int]:
     """
     Compare ground truth and consolidation texts.
@@ -52,31 +96,40 @@ def compare_texts(gt_text: str, consolidation_text: str, alphanumeric_only: bool
     Returns:
         Tuple of (match_percentage, mismatch_count)
     """
-    gt_normalized = normalize_text(gt_text)
-    consolidation_normalized = normalize_text(consolidation_text)
-    
-    if alphanumeric_only:
-        gt_normalized = filter_alphanumeric(gt_normalized)
-        consolidation_normalized = filter_alphanumeric(consolidation_normalized)
-    
-    gt_chars = count_characters(gt_normalized)
-    consolidation_chars = count_characters(consolidation_normalized)
+    return compare_char_counts(
+        count_characters(normalize_text(gt_text)),
+        count_characters(normalize_text(consolidation_text)),
+        alphanumeric_only=alphanumeric_only
+    )
+
+
+def compare_char_counts(gt_chars: Counter, consolidation_chars: Counter, alphanumeric_only: bool = False) -> tuple[float, int]:
+    """
+    Compare character counts of normalized ground truth and consolidation texts.
     
-    # Get all unique characters from both texts
-    all_chars = set(gt_chars.keys()) | set(consolidation_chars.keys())
+    Lets callers count each text once and reuse the counts for several comparisons.
     
-    # Count matches and mismatches
-    matches = 0
-    mismatches = 0
+    Args:
+        gt_chars: Character counts of the normalized ground truth text
+        consolidation_chars: Character counts of the normalized consolidation text
+        alphanumeric_only: If True, only compare letters and numbers
     
-    for char in all_chars:
-        gt_count = gt_chars.get(char, 0)
-        consolidation_count = consolidation_chars.get(char, 0)
-        
-        # Count matching characters (min of the two counts)
-        matches += min(gt_count, consolidation_count)
-        # Count mismatches (difference in counts)
-        mismatches += abs(gt_count - consolidation_count)
+    Returns:
+        Tuple of (match_percentage, mismatch_count)
+    """
+    if alphanumeric_only:
+        # Filter the counts rather than the texts: the category lookup then runs
+        # once per distinct character instead of once per character
+        gt_chars = filter_alphanumeric_counts(gt_chars)
+        consolidation_chars = filter_alphanumeric_counts(consolidation_chars)
+    
+    # Count matching characters (min of the two counts per character)
+    matches = sum((gt_chars & consolidation_chars).values())
+    # Count mismatches (difference in counts, in either direction)
+    mismatches = (
+        sum((gt_chars - consolidation_chars).values())
+        + sum((consolidation_chars - gt_chars).values())
+    )
     
     # Calculate match percentage based on matches vs total characters considered
     total_chars_considered = matches + mismatches
@@ -88,25 +141,126 @@ def compare_texts(gt_text: str, consolidation_text: str, alphanumeric_only: bool
     return match_percentage, mismatches
 
 
-def levenshtein_distance(s1: str, s2: str) -> int:
-    """Calculate Levenshtein edit distance between two strings."""
+def levenshtein_distance(s1: str | list[str], s2: str | list[str], max_dist: int | None = None) -> int:
+    """
+    Calculate Levenshtein edit distance between two strings (or two lists of words).
+    
+    If max_dist is given and the distance is larger, max_dist + 1 is returned
+    as soon as that is certain, without finishing the computation.
+    """
+    if _c_levenshtein_distance is not None:
+        return _c_levenshtein_distance(s1, s2, score_cutoff=max_dist)
+    return _py_levenshtein_distance(s1, s2, max_dist)
+
+
+def _py_levenshtein_distance(s1: str | list[str], s2: str | list[str], max_dist: int | None = None) -> int:
+    """Pure-Python Levenshtein distance, used when python-Levenshtein is not installed."""
+    # OCR text mostly matches, and the common prefix and suffix never add to the
+    # distance, so drop them before the quadratic part
+    s1, s2 = _trim_common_affixes(s1, s2)
+    
+    # Iterate the shorter string in the inner loop so the rows stay short
     if len(s1) < len(s2):
-        return levenshtein_distance(s2, s1)
+        s1, s2 = s2, s1
     
-    if len(s2) == 0:
+    n = len(s2)
+    # The distance is at least the length difference
+    if max_dist is not None and len(s1) - n > max_dist:
+        return max_dist + 1
+    if n == 0:
         return len(s1)
     
-    previous_row = list(range(len(s2) + 1))
+    if n <= _MYERS_MAX_PATTERN_LENGTH:
+        distance = _myers_distance(s2, s1)
+        if max_dist is not None and distance > max_dist:
+            return max_dist + 1
+        return distance
+    
+    # Two preallocated rows, swapped after each outer step. Plain lists index
+    # faster than array('i') in CPython, and the inlined comparisons avoid the
+    # tuple that min() would build for every cell.
+    previous_row = list(range(n + 1))
+    current_row = [0] * (n + 1)
     for i, c1 in enumerate(s1):
-        current_row = [i + 1]
-        for j, c2 in enumerate(s2):
-            insertions = previous_row[j + 1] + 1
-            deletions = current_row[j] + 1
-            substitutions = previous_row[j] + (c1 != c2)
-            current_row.append(min(insertions, deletions, substitutions))
-        previous_row = current_row
-    
-    return previous_row[-1]
+        left = i + 1
+        current_row[0] = left
+        diagonal = previous_row[0]
+        for j, c2 in enumerate(s2, 1):
+            up = previous_row[j]
+            if c1 == c2:
+                # Neighbouring cells differ by at most 1, so a match is always the minimum
+                value = diagonal
+            else:
+                value = diagonal if diagonal < up else up
+                if left < value:
+                    value = left
+                value += 1
+            current_row[j] = left = value
+            diagonal = up
+        # Values never decrease along a path, so the row minimum is a lower bound
+        if max_dist is not None and min(current_row) > max_dist:
+            return max_dist + 1
+        previous_row, current_row = current_row, previous_row
+    
+    distance = previous_row[n]
+    if max_dist is not None and distance > max_dist:
+        return max_dist + 1
+    return distance
+
+
+def _trim_common_affixes(a: str | list[str], b: str | list[str]) -> tuple[str | list[str], str | list[str]]:
+    """Remove the common prefix and suffix of two sequences."""
+    limit = min(len(a), len(b))
+    prefix = 0
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    limit -= prefix
+    suffix = 0
+    while suffix < limit and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    return a[prefix:len(a) - suffix], b[prefix:len(b) - suffix]
+
+
+# Patterns up to this length fit one machine word in Myers' algorithm
+_MYERS_MAX_PATTERN_LENGTH = 64
+
+
+def _myers_distance(pattern: str | list[str], text: str | list[str]) -> int:
+    """
+    Levenshtein distance with Myers' bit-parallel algorithm (Hyyrö's formulation).
+
+    Each DP column is held as bit vectors of vertical +1/-1 deltas, so one step
+    over a text character updates the whole column with a few integer ops.
+    pattern must be non-empty; it should be the shorter string.
+    """
+    m = len(pattern)
+    mask = (1 << m) - 1
+    last_bit = 1 << (m - 1)
+
+    # Bit i of pattern_masks[c] is set where pattern[i] == c
+    pattern_masks: dict[str, int] = {}
+    for i, c in enumerate(pattern):
+        pattern_masks[c] = pattern_masks.get(c, 0) | (1 << i)
+
+    vertical_positive = mask
+    vertical_negative = 0
+    score = m
+    for c in text:
+        eq = pattern_masks.get(c, 0)
+        x_vertical = eq | vertical_negative
+        x_horizontal = (((eq & vertical_positive) + vertical_positive) ^ vertical_positive) | eq
+        horizontal_positive = vertical_negative | ~(x_horizontal | vertical_positive)
+        horizontal_negative = vertical_positive & x_horizontal
+        if horizontal_positive & last_bit:
+            score += 1
+        elif horizontal_negative & last_bit:
+            score -= 1
+        horizontal_positive = (horizontal_positive << 1) | 1
+        horizontal_negative <<= 1
+        # Python ints are unbounded, so mask the negations back to m bits
+        vertical_positive = (horizontal_negative | ~(x_vertical | horizontal_positive)) & mask
+        vertical_negative = horizontal_positive & x_vertical & mask
+    return score
 
 
 def normalize_line(line: str) -> str:
@@ -124,42 +278,41 @@ def normalize_for_wer(text: str) -> str:
     - treat any non-letter / non-number (including punctuation and "/" ) as a separator
     - collapse whitespace
     """
-    folded = text.casefold()
-    out_chars: list[str] = []
-    for c in folded:
-        if unicodedata.category(c).startswith(("L", "N")):
-            out_chars.append(c)
-        else:
-            out_chars.append(" ")
-    return " ".join("".join(out_chars).split())
+    return " ".join(_NON_ALPHANUMERIC_RE.sub(" ", text.casefold()).split())
 
 
 def normalize_for_cer(text: str) -> str:
     """
     Normalize text for CER where whitespace and punctuation should not matter.
-    This uses `normalize_for_wer` then removes all spaces.
+    Same as `normalize_for_wer` with all spaces removed.
     """
-    return normalize_for_wer(text).replace(" ", "")
+    return _NON_ALPHANUMERIC_RE.sub("", text.casefold())
 
 
-def _generate_spans(lines: list[str], max_span_lines: int) -> list[tuple[int, int, str]]:
+def _generate_spans(norm_lines: list[str], max_span_lines: int) -> tuple[array, array, list[str]]:
     """
-    Generate consecutive-line spans.
+    Generate consecutive-line spans from lines normalized with `normalize_for_wer`.
+
+    Normalizing lines joined with spaces gives the same text as joining the
+    non-empty normalized lines, so each line only has to be normalized once.
+    Spans without any letters or numbers are skipped.
 
-    Returns tuples of (start_idx, end_idx_exclusive, span_text).
+    Returns parallel sequences (start_indices, end_indices_exclusive, span_texts).
     """
-    spans: list[tuple[int, int, str]] = []
-    n = len(lines)
+    starts = array('i')
+    ends = array('i')
+    texts: list[str] = []
+    n = len(norm_lines)
     for start in range(n):
-        for length in range(1, max_span_lines + 1):
-            end = start + length
-            if end > n:
-                break
-            # Join with space so line breaks don't affect matching/tokenization.
-            span_text = " ".join(normalize_line(l) for l in lines[start:end]).strip()
-            if span_text:
-                spans.append((start, end, span_text))
-    return spans
+        parts: list[str] = []
+        for end in range(start + 1, min(start + max_span_lines, n) + 1):
+            if norm_lines[end - 1]:
+                parts.append(norm_lines[end - 1])
+            if parts:
+                starts.append(start)
+                ends.append(end)
+                texts.append(" ".join(parts))
+    return starts, ends, texts
 
 
 def match_spans(
@@ -184,48 +337,122 @@ def match_spans(
         List of tuples (gt_start, gt_end, cons_start, cons_end, similarity_score)
         where similarity_score is normalized (0-1, higher is better).
     """
-    gt_spans = _generate_spans(gt_lines, max_gt_span_lines)
-    cons_spans = _generate_spans(consolidation_lines, max_consolidation_span_lines)
+    return _match_normalized_spans(
+        [normalize_for_wer(line) for line in gt_lines],
+        [normalize_for_wer(line) for line in consolidation_lines],
+        max_gt_span_lines=max_gt_span_lines,
+        max_consolidation_span_lines=max_consolidation_span_lines,
+        similarity_threshold=similarity_threshold,
+    )
+
+
+def _match_normalized_spans(
+    gt_norm_lines: list[str],
+    consolidation_norm_lines: list[str],
+    *,
+    max_gt_span_lines: int,
+    max_consolidation_span_lines: int,
+    similarity_threshold: float,
+) -> list[tuple[int, int, int, int, float]]:
+    """`match_spans` on lines already normalized with `normalize_for_wer`."""
+    # Spans are kept as parallel arrays: the pairing loop only needs the
+    # normalized texts, and start/end are looked up for accepted pairs only
+    gt_starts, gt_ends, gt_norms = _generate_spans(gt_norm_lines, max_gt_span_lines)
+    cons_starts, cons_ends, cons_norms = _generate_spans(consolidation_norm_lines, max_consolidation_span_lines)
+
+    # The distance is at least the length difference, so similarity can only reach
+    # the threshold when the shorter/longer length ratio does. Sorting by length
+    # lets each GT span visit just that window of consolidation spans.
+    cons_order = sorted(range(len(cons_norms)), key=lambda i: len(cons_norms[i]))
+    cons_starts = array('i', (cons_starts[i] for i in cons_order))
+    cons_ends = array('i', (cons_ends[i] for i in cons_order))
+    cons_norms = [cons_norms[i] for i in cons_order]
+    cons_lengths = array('i', (len(cons_norm) for cons_norm in cons_norms))
 
     candidates: list[tuple[float, int, int, int, int]] = []
     # candidates entries: (similarity, gt_start, gt_end, cons_start, cons_end)
-    for gt_start, gt_end, gt_text in gt_spans:
-        gt_norm = normalize_for_wer(gt_text)
-        if not gt_norm:
-            continue
-        for cons_start, cons_end, cons_text in cons_spans:
-            cons_norm = normalize_for_wer(cons_text)
-            if not cons_norm:
-                continue
-
-            distance = levenshtein_distance(gt_norm, cons_norm)
-            max_len = max(len(gt_norm), len(cons_norm))
+    for gt_index, gt_norm in enumerate(gt_norms):
+        gt_len = len(gt_norm)
+        if similarity_threshold > 0:
+            # Widened by one so float rounding never drops a borderline span
+            low = bisect_left(cons_lengths, gt_len * similarity_threshold - 1)
+            high = bisect_right(cons_lengths, gt_len / similarity_threshold + 1)
+        else:
+            low, high = 0, len(cons_norms)
+        for cons_index, cons_norm in enumerate(cons_norms[low:high], low):
+            max_len = max(gt_len, len(cons_norm))
+            if cons_norm == gt_norm:
+                # Identical spans are common and need no distance computation
+                distance = 0
+            else:
+                # Any distance above this can't reach the threshold; the +1 keeps
+                # borderline cases for the exact similarity check below
+                max_dist = int((1.0 - similarity_threshold) * max_len) + 1
+                distance = levenshtein_distance(gt_norm, cons_norm, max_dist)
+                if distance > max_dist:
+                    continue
             similarity = 1.0 if max_len == 0 else 1.0 - (distance / max_len)
             if similarity >= similarity_threshold:
-                candidates.append((similarity, gt_start, gt_end, cons_start, cons_end))
+                candidates.append((
+                    similarity,
+                    gt_starts[gt_index], gt_ends[gt_index],
+                    cons_starts[cons_index], cons_ends[cons_index]
+                ))
 
     # Greedy global selection: pick best matches first, ensure spans don't overlap.
-    candidates.sort(key=lambda x: (-x[0], -((x[2] - x[1]) + (x[4] - x[3])), x[1], x[3]))
-
-    used_gt_indices: set[int] = set()
-    used_cons_indices: set[int] = set()
+    # Span ends break the remaining ties so the order doesn't depend on the
+    # order candidates were found in
+    candidates.sort(key=lambda x: (-x[0], -((x[2] - x[1]) + (x[4] - x[3])), x[1], x[3], x[2], x[4]))
+
+    # Line indices are dense, so used lines are kept as byte flags and the
+    # overlap checks run in C on bytearray slices
+    used_gt = bytearray(len(gt_norm_lines))
+    used_cons = bytearray(len(consolidation_norm_lines))
     matches: list[tuple[int, int, int, int, float]] = []
 
+    # Every candidate span contains at least one line with letters or numbers,
+    # so once either side has no such line left unused, nothing else can fit
+    gt_content = bytearray(1 if norm else 0 for norm in gt_norm_lines)
+    cons_content = bytearray(1 if norm else 0 for norm in consolidation_norm_lines)
+    gt_remaining = gt_content.count(1)
+    cons_remaining = cons_content.count(1)
+
     for similarity, gt_start, gt_end, cons_start, cons_end in candidates:
-        gt_range = range(gt_start, gt_end)
-        cons_range = range(cons_start, cons_end)
-        if any(i in used_gt_indices for i in gt_range):
+        if 1 in used_gt[gt_start:gt_end]:
             continue
-        if any(i in used_cons_indices for i in cons_range):
+        if 1 in used_cons[cons_start:cons_end]:
             continue
 
         matches.append((gt_start, gt_end, cons_start, cons_end, similarity))
-        used_gt_indices.update(gt_range)
-        used_cons_indices.update(cons_range)
+        used_gt[gt_start:gt_end] = b"\x01" * (gt_end - gt_start)
+        used_cons[cons_start:cons_end] = b"\x01" * (cons_end - cons_start)
+
+        gt_remaining -= gt_content.count(1, gt_start, gt_end)
+        cons_remaining -= cons_content.count(1, cons_start, cons_end)
+        if gt_remaining == 0 or cons_remaining == 0:
+            break
 
     return matches
 
 
+def _count_edit_operations(reference, hypothesis) -> tuple[int, int, int]:
+    """
+    Count (substitutions, insertions, deletions) of an optimal alignment with python-Levenshtein.
+
+    Works on strings and on lists of words. When several alignments are equally
+    cheap, the breakdown may differ from the DP backtrack, but the total is the same.
+    """
+    substitutions = insertions = deletions = 0
+    for operation, _, _ in _c_editops(reference, hypothesis):
+        if operation == "replace":
+            substitutions += 1
+        elif operation == "insert":
+            insertions += 1
+        else:
+            deletions += 1
+    return substitutions, insertions, deletions
+
+
 def calculate_wer(reference: str, hypothesis: str) -> tuple[float, int, int, int]:
     """
     Calculate Word Error Rate (WER) using edit distance.
@@ -248,6 +475,11 @@ def calculate_wer(reference: str, hypothesis: str) -> tuple[float, int, int, int
         else:
             return 100.0, 0, len(hyp_words), 0
     
+    if _c_editops is not None:
+        substitutions, insertions, deletions = _count_edit_operations(ref_words, hyp_words)
+        wer = ((substitutions + insertions + deletions) / len(ref_words)) * 100
+        return wer, substitutions, insertions, deletions
+    
     # Calculate edit distance at word level
     # Use dynamic programming
     dp = [[0] * (len(hyp_words) + 1) for _ in range(len(ref_words) + 1)]
@@ -315,6 +547,11 @@ def calculate_cer(reference: str, hypothesis: str) -> tuple[float, int, int, int
         else:
             return 100.0, 0, len(hypothesis), 0
     
+    if _c_editops is not None:
+        substitutions, insertions, deletions = _count_edit_operations(reference, hypothesis)
+        cer = ((substitutions + insertions + deletions) / len(reference)) * 100
+        return cer, substitutions, insertions, deletions
+    
     # Build DP table for edit distance and backtracking
     dp = [[0] * (len(hypothesis) + 1) for _ in range(len(reference) + 1)]
     
@@ -382,10 +619,15 @@ def calculate_wer_cer_two_level(gt_text: str, consolidation_text: str) -> tuple[
     gt_lines = [line for line in gt_text.split("\n")]
     consolidation_lines = [line for line in consolidation_text.split("\n")]
 
+    # Normalize every line once; span texts are joined from these instead of
+    # normalizing each span again (see _generate_spans)
+    gt_norm_lines = [normalize_for_wer(line) for line in gt_lines]
+    cons_norm_lines = [normalize_for_wer(line) for line in consolidation_lines]
+
     # Match spans (order-flex at span granularity)
-    span_matches = match_spans(
-        gt_lines,
-        consolidation_lines,
+    span_matches = _match_normalized_spans(
+        gt_norm_lines,
+        cons_norm_lines,
         max_gt_span_lines=3,
         max_consolidation_span_lines=2,
         similarity_threshold=0.5,
@@ -397,64 +639,61 @@ def calculate_wer_cer_two_level(gt_text: str, consolidation_text: str) -> tuple[
     total_word_errors = 0
     total_char_errors = 0
     
-    matched_gt_indices: set[int] = set()
-    matched_cons_indices: set[int] = set()
+    matched_gt = bytearray(len(gt_lines))
+    matched_cons = bytearray(len(consolidation_lines))
 
     # Process matched spans
     for gt_start, gt_end, cons_start, cons_end, similarity in span_matches:
-        matched_gt_indices.update(range(gt_start, gt_end))
-        matched_cons_indices.update(range(cons_start, cons_end))
+        matched_gt[gt_start:gt_end] = b"\x01" * (gt_end - gt_start)
+        matched_cons[cons_start:cons_end] = b"\x01" * (cons_end - cons_start)
 
-        gt_span_text = " ".join(normalize_line(l) for l in gt_lines[gt_start:gt_end]).strip()
-        cons_span_text = " ".join(normalize_line(l) for l in consolidation_lines[cons_start:cons_end]).strip()
+        # Same as normalizing the joined span text; empty lines only add spaces
+        gt_for_wer = " ".join(gt_norm_lines[gt_start:gt_end])
+        cons_for_wer = " ".join(cons_norm_lines[cons_start:cons_end])
 
-        gt_for_wer = normalize_for_wer(gt_span_text)
-        cons_for_wer = normalize_for_wer(cons_span_text)
+        # Only the totals are needed here, so use the plain edit distance instead of
+        # calculate_wer/calculate_cer and their sub/ins/del breakdown.
+        # Matched spans always have a non-empty normalized GT side.
 
         # WER (word-level)
-        wer, _, _, _ = calculate_wer(gt_for_wer, cons_for_wer)
-        ref_words = len(gt_for_wer.split())
-        total_ref_words += ref_words
-        total_word_errors += (wer / 100.0) * ref_words
+        gt_words = gt_for_wer.split()
+        total_ref_words += len(gt_words)
+        total_word_errors += levenshtein_distance(gt_words, cons_for_wer.split())
 
         # CER (character-level), ignoring spaces entirely
-        gt_for_cer = normalize_for_cer(gt_span_text)
-        cons_for_cer = normalize_for_cer(cons_span_text)
-        cer, _, _, _ = calculate_cer(gt_for_cer, cons_for_cer)
-        ref_chars = len(gt_for_cer)
-        total_ref_chars += ref_chars
-        total_char_errors += (cer / 100.0) * ref_chars
-    
-    # Count unmatched GT lines as deletions (all tokens/chars are missing)
-    for gt_idx, gt_line in enumerate(gt_lines):
-        if gt_idx not in matched_gt_indices:
-            gt_line_norm = normalize_line(gt_line)
-            if not gt_line_norm:
-                continue
-            gt_for_wer = normalize_for_wer(gt_line_norm)
-            gt_for_cer = normalize_for_cer(gt_line_norm)
-            if gt_for_wer:
-                ref_words = len(gt_for_wer.split())
-                total_ref_words += ref_words
-                total_word_errors += ref_words
-            if gt_for_cer:
-                ref_chars = len(gt_for_cer)
-                total_ref_chars += ref_chars
-                total_char_errors += ref_chars
+        gt_for_cer = gt_for_wer.replace(" ", "")
+        cons_for_cer = cons_for_wer.replace(" ", "")
+        total_ref_chars += len(gt_for_cer)
+        total_char_errors += levenshtein_distance(gt_for_cer, cons_for_cer)
+    
+    # Count unmatched GT lines as deletions (all tokens/chars are missing).
+    # The same pass counts the non-empty unmatched lines for the details.
+    unmatched_gt_lines = 0
+    for matched, gt_line, gt_for_wer in zip(matched_gt, gt_lines, gt_norm_lines):
+        if matched or not normalize_line(gt_line):
+            continue
+        unmatched_gt_lines += 1
+        if gt_for_wer:
+            # Normalized text has single spaces between words; CER ignores them
+            spaces = gt_for_wer.count(" ")
+            ref_words = spaces + 1
+            total_ref_words += ref_words
+            total_word_errors += ref_words
+            ref_chars = len(gt_for_wer) - spaces
+            total_ref_chars += ref_chars
+            total_char_errors += ref_chars
     
     # Count unmatched consolidation lines as insertions (errors).
     # Note: Insertions don't increase the reference length, only error count.
-    for cons_idx, cons_line in enumerate(consolidation_lines):
-        if cons_idx not in matched_cons_indices:
-            cons_line_norm = normalize_line(cons_line)
-            if not cons_line_norm:
-                continue
-            cons_for_wer = normalize_for_wer(cons_line_norm)
-            cons_for_cer = normalize_for_cer(cons_line_norm)
-            if cons_for_wer:
-                total_word_errors += len(cons_for_wer.split())
-            if cons_for_cer:
-                total_char_errors += len(cons_for_cer)
+    unmatched_cons_lines = 0
+    for matched, cons_line, cons_for_wer in zip(matched_cons, consolidation_lines, cons_norm_lines):
+        if matched or not normalize_line(cons_line):
+            continue
+        unmatched_cons_lines += 1
+        if cons_for_wer:
+            spaces = cons_for_wer.count(" ")
+            total_word_errors += spaces + 1
+            total_char_errors += len(cons_for_wer) - spaces
     
     # Calculate final WER and CER
     if total_ref_words == 0:
@@ -470,16 +709,8 @@ def calculate_wer_cer_two_level(gt_text: str, consolidation_text: str) -> tuple[
     details = {
         # Backward-compatible key names (now they mean "spans"/"lines used by spans")
         "matched_lines": len(span_matches),
-        "unmatched_gt_lines": len(
-            [i for i, line in enumerate(gt_lines) if i not in matched_gt_indices and normalize_line(line)]
-        ),
-        "unmatched_cons_lines": len(
-            [
-                i
-                for i, line in enumerate(consolidation_lines)
-                if i not in matched_cons_indices and normalize_line(line)
-            ]
-        ),
+        "unmatched_gt_lines": unmatched_gt_lines,
+        "unmatched_cons_lines": unmatched_cons_lines,
         "matched_spans": len(span_matches),
         "total_ref_words": total_ref_words,
         "total_ref_chars": total_ref_chars,
@@ -488,43 +719,26 @@ def calculate_wer_cer_two_level(gt_text: str, consolidation_text: str) -> tuple[
     return wer, cer, details
 
 
-# Validate DATATYPE
-if DATATYPE not in ("consolidation", "alignment"):
-    raise ValueError(f"DATATYPE must be 'consolidation' or 'alignment', got '{DATATYPE}'")
-
-# Combine run_version and branch_version for cache
-if branch_version:
-    cache_version = f"{run_version}{branch_version}"
-else:
-    cache_version = run_version
-
-# Process each folder
-print("=" * 50)
-print(f"Comparing {DATATYPE} to ground truth")
-print(f"Run version: {run_version}")
-if branch_version:
-    print(f"Branch version: {branch_version}")
-print(f"Cache version: {cache_version}")
-print("=" * 50)
-
-match_percentages = []
-alphanumeric_match_percentages = []
-wer_values = []
-cer_values = []
-
-for folder_name in folder_names:
-    print(f"\n{folder_name}:")
+def load_folder(folder_name: str, cache_version: str) -> tuple[str | None, str | None, str | None]:
+    """
+    Read the ground truth and the cached data text of one folder.
+    
+    Args:
+        folder_name: Folder with gt.txt and the run cache
+        cache_version: Run version (with branch) of the cache to compare
     
+    Returns:
+        Tuple of (gt_text, data_text, warning); the texts are None and warning
+        explains why if the folder has to be skipped
+    """
     base_folder = Path(folder_name)
     
     # Load ground truth
     gt_path = base_folder / "gt.txt"
-    if not gt_path.exists():
-        print(f"Warning: {gt_path} not found, skipping...")
-        continue
-    
-    with open(gt_path, 'r', encoding='utf-8') as f:
-        gt_text = f.read()
+    try:
+        gt_text = gt_path.read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return None, None, f"Warning: {gt_path} not found, skipping..."
     
     # Load data based on DATATYPE
     try:
@@ -535,49 +749,129 @@ for folder_name in folder_names:
             cache_data = load_alignment_cache(base_folder, cache_version)
             data_text = cache_data["data"]["alignment"]
     except FileNotFoundError:
-        print(f"Warning: {DATATYPE.capitalize()} cache not found for run_{cache_version}, skipping...")
-        continue
+        return None, None, f"Warning: {DATATYPE.capitalize()} cache not found for run_{cache_version}, skipping..."
+    
+    return gt_text, data_text, None
+
+
+def process_folder(gt_text: str, data_text: str) -> tuple[list[str], dict]:
+    """
+    Compare one folder's data against its ground truth.
+    
+    Runs in a worker process, so the report lines are returned instead of printed
+    to keep the output of different folders from interleaving.
+    
+    Args:
+        gt_text: Ground truth text
+        data_text: Consolidation or alignment text
+    
+    Returns:
+        Tuple of (output_lines, metrics)
+    """
+    output: list[str] = []
     
     # Print texts
-    print("Ground truth:")
-    print(gt_text)
-    print(f"\n{DATATYPE.capitalize()}:")
-    print(data_text)
+    output.append("Ground truth:")
+    output.append(gt_text)
+    output.append(f"\n{DATATYPE.capitalize()}:")
+    output.append(data_text)
+    
+    # Normalize and count each text once for both comparisons
+    gt_chars = count_characters(normalize_text(gt_text))
+    data_chars = count_characters(normalize_text(data_text))
     
     # Compare (all characters)
-    match_percentage, mismatch_count = compare_texts(gt_text, data_text, alphanumeric_only=False)
+    match_percentage, mismatch_count = compare_char_counts(gt_chars, data_chars, alphanumeric_only=False)
     
     # Compare (alphanumeric only)
-    alphanumeric_match_percentage, alphanumeric_mismatch_count = compare_texts(gt_text, data_text, alphanumeric_only=True)
+    alphanumeric_match_percentage, alphanumeric_mismatch_count = compare_char_counts(gt_chars, data_chars, alphanumeric_only=True)
     
-    print(f"\nMatch percentage (all characters): {match_percentage:.2f}%")
-    print(f"Mismatch character count (all characters): {mismatch_count}")
-    print(f"Match percentage (alphanumeric only): {alphanumeric_match_percentage:.2f}%")
-    print(f"Mismatch character count (alphanumeric only): {alphanumeric_mismatch_count}")
+    output.append(f"\nMatch percentage (all characters): {match_percentage:.2f}%")
+    output.append(f"Mismatch character count (all characters): {mismatch_count}")
+    output.append(f"Match percentage (alphanumeric only): {alphanumeric_match_percentage:.2f}%")
+    output.append(f"Mismatch character count (alphanumeric only): {alphanumeric_mismatch_count}")
     
     # Calculate WER and CER using two-level span matching + normalization
     wer, cer, details = calculate_wer_cer_two_level(gt_text, data_text)
-    print(f"\nWord Error Rate (WER, span-matched, normalized): {wer:.2f}%")
-    print(f"Character Error Rate (CER, span-matched, normalized): {cer:.2f}%")
-    print(f"Matched spans: {details['matched_spans']}")
-    print(f"Unmatched GT lines: {details['unmatched_gt_lines']}")
-    print(f"Unmatched {DATATYPE} lines: {details['unmatched_cons_lines']}")
-    
-    match_percentages.append(match_percentage)
-    alphanumeric_match_percentages.append(alphanumeric_match_percentage)
-    wer_values.append(wer)
-    cer_values.append(cer)
-
-# Calculate and print averages
-if match_percentages:
-    average_match = sum(match_percentages) / len(match_percentages)
-    average_alphanumeric_match = sum(alphanumeric_match_percentages) / len(alphanumeric_match_percentages)
-    average_wer = sum(wer_values) / len(wer_values)
-    average_cer = sum(cer_values) / len(cer_values)
-    print("\n" + "=" * 50)
-    print(f"Average match percentage (all characters): {average_match:.2f}%")
-    print(f"Average match percentage (alphanumeric only): {average_alphanumeric_match:.2f}%")
-    print(f"Average Word Error Rate (WER, span-matched, normalized): {average_wer:.2f}%")
-    print(f"Average Character Error Rate (CER, span-matched, normalized): {average_cer:.2f}%")
-    print("=" * 50)
+    output.append(f"\nWord Error Rate (WER, span-matched, normalized): {wer:.2f}%")
+    output.append(f"Character Error Rate (CER, span-matched, normalized): {cer:.2f}%")
+    output.append(f"Matched spans: {details['matched_spans']}")
+    output.append(f"Unmatched GT lines: {details['unmatched_gt_lines']}")
+    output.append(f"Unmatched {DATATYPE} lines: {details['unmatched_cons_lines']}")
+    
+    metrics = {
+        "match_percentage": match_percentage,
+        "alphanumeric_match_percentage": alphanumeric_match_percentage,
+        "wer": wer,
+        "cer": cer,
+    }
+    return output, metrics
+
 
+def main() -> None:
+    # Validate DATATYPE
+    if DATATYPE not in ("consolidation", "alignment"):
+        raise ValueError(f"DATATYPE must be 'consolidation' or 'alignment', got '{DATATYPE}'")
+    
+    # Combine run_version and branch_version for cache
+    if branch_version:
+        cache_version = f"{run_version}{branch_version}"
+    else:
+        cache_version = run_version
+    
+    # Process each folder
+    print("=" * 50)
+    print(f"Comparing {DATATYPE} to ground truth")
+    print(f"Run version: {run_version}")
+    if branch_version:
+        print(f"Branch version: {branch_version}")
+    print(f"Cache version: {cache_version}")
+    print("=" * 50)
+    
+    match_percentages = []
+    alphanumeric_match_percentages = []
+    wer_values = []
+    cer_values = []
+    
+    # Read all input files up front with threads, so that slow storage doesn't
+    # leave the worker processes waiting on I/O
+    with ThreadPoolExecutor(max_workers=8) as io_executor:
+        loaded = list(io_executor.map(load_folder, folder_names, repeat(cache_version)))
+    
+    # Folders are independent, so compare them in parallel processes
+    # and print the results in the original folder order
+    max_workers = max(1, min(len(folder_names), os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            None if warning else executor.submit(process_folder, gt_text, data_text)
+            for gt_text, data_text, warning in loaded
+        ]
+        for folder_name, (_, _, warning), future in zip(folder_names, loaded, futures):
+            print(f"\n{folder_name}:")
+            if future is None:
+                print(warning)
+                continue
+            output, metrics = future.result()
+            for line in output:
+                print(line)
+            match_percentages.append(metrics["match_percentage"])
+            alphanumeric_match_percentages.append(metrics["alphanumeric_match_percentage"])
+            wer_values.append(metrics["wer"])
+            cer_values.append(metrics["cer"])
+    
+    # Calculate and print averages
+    if match_percentages:
+        average_match = sum(match_percentages) / len(match_percentages)
+        average_alphanumeric_match = sum(alphanumeric_match_percentages) / len(alphanumeric_match_percentages)
+        average_wer = sum(wer_values) / len(wer_values)
+        average_cer = sum(cer_values) / len(cer_values)
+        print("\n" + "=" * 50)
+        print(f"Average match percentage (all characters): {average_match:.2f}%")
+        print(f"Average match percentage (alphanumeric only): {average_alphanumeric_match:.2f}%")
+        print(f"Average Word Error Rate (WER, span-matched, normalized): {average_wer:.2f}%")
+        print(f"Average Character Error Rate (CER, span-matched, normalized): {average_cer:.2f}%")
+        print("=" * 50)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,17 @@ from pathlib import Path
 from datetime import datetime
 
 
+def _write_cache_file(cache_path: Path, cache_data: dict) -> None:
+    """
+    Write cache data to a JSON file in a single write call.
+    
+    json.dump() issues one small write per encoded fragment; serializing to a
+    string first keeps it to one write per cache file.
+    """
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(cache_data, indent=2, ensure_ascii=False))
+
+
 def get_cache_path(image_file: Path, run_version: str) -> Path:
     """
     Get the cache file path for an image file.
@@ -100,8 +111,7 @@ def save_cache(
         }
     }
     
-    with open(cache_path, 'w', encoding='utf-8') as f:
-        json.dump(cache_data, f, indent=2, ensure_ascii=False)
+    _write_cache_file(cache_path, cache_data)
     
     return cache_path
 
@@ -206,8 +216,7 @@ def save_consolidation_cache(
         }
     }
     
-    with open(cache_path, 'w', encoding='utf-8') as f:
-        json.dump(cache_data, f, indent=2, ensure_ascii=False)
+    _write_cache_file(cache_path, cache_data)
     
     return cache_path
 
@@ -313,7 +322,6 @@ def save_alignment_cache(
         }
     }
     
-    with open(cache_path, 'w', encoding='utf-8') as f:
-        json.dump(cache_data, f, indent=2, ensure_ascii=False)
+    _write_cache_file(cache_path, cache_data)
     
     return cache_path
@@ -1,13 +1,47 @@
 """Helper functions for Google Gemini API calls."""
+import asyncio
+import atexit
+import contextlib
 import os
+import threading
+import time
+from pathlib import Path
 import google.genai as genai
-from google.genai import types
-from typing import Any
+from google.genai import errors, types
+from typing import Any, Callable
+
+from image_utils import load_image_as_part
+from llm_cache import LLMCache, make_cache_key
+from semantic_cache import SemanticCache
+
+
+# Clients are reused so their HTTP connection pools (and TLS sessions) survive
+# across calls; keyed by the settings that determine which backend is used.
+_CLIENT_CACHE: dict[tuple, genai.Client] = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
+
+# Lower bound on characters per token for label text (often ~3-4), used to
+# derive max_output_tokens from max_chars
+CHARS_PER_TOKEN_ESTIMATE = 2
+THINKING_TOKEN_HEADROOM = 4096
+
+# Server-side context caches for system prompts, keyed by (model, prompt).
+# Values are (cache name or None if creation failed, monotonic expiry time).
+CONTEXT_CACHE_TTL_SECONDS = 3600
+# Smallest prompt Gemini will cache (some models require more); shorter
+# prompts are sent inline without trying
+CONTEXT_CACHE_MIN_TOKENS = 1024
+_CONTEXT_CACHES: dict[tuple[str, str], tuple[str | None, float]] = {}
+_CONTEXT_CACHES_LOCK = threading.Lock()
+
+# Optional exact-match response cache, enabled by setting LLM_CACHE_PATH.
+_LLM_CACHE: LLMCache | None = None
+_LLM_CACHE_LOCK = threading.Lock()
 
 
 def get_gemini_client(use_vertex_ai: bool = False) -> genai.Client:
     """
-    Initialize and return a Gemini client.
+    Return a Gemini client, reusing an existing one for the same settings.
 
     When use_vertex_ai is True, uses Application Default Credentials (ADC) with
     GOOGLE_CLOUD_PROJECT and GOOGLE_CLOUD_LOCATION env vars.
@@ -21,12 +55,90 @@ def get_gemini_client(use_vertex_ai: bool = False) -> genai.Client:
                 "GOOGLE_CLOUD_PROJECT is not set. "
                 "Please set it in .env and ensure GOOGLE_APPLICATION_CREDENTIALS points to your ADC JSON."
             )
-        return genai.Client(vertexai=True, project=project, location=location)
+        cache_key = (True, project, location)
+        client_kwargs: dict[str, Any] = {"vertexai": True, "project": project, "location": location}
+    else:
+        api_key = os.getenv("GEMINI_DEVELOPER_API_KEY")
+        if not api_key:
+            raise ValueError("API key is not set. Please set GEMINI_DEVELOPER_API_KEY in .env.")
+        cache_key = (False, api_key)
+        client_kwargs = {"api_key": api_key}
 
-    api_key = os.getenv("GEMINI_DEVELOPER_API_KEY")
-    if not api_key:
-        raise ValueError("API key is not set. Please set GEMINI_DEVELOPER_API_KEY in .env.")
-    return genai.Client(api_key=api_key)
+    with _CLIENT_CACHE_LOCK:
+        client = _CLIENT_CACHE.get(cache_key)
+        if client is None:
+            client = genai.Client(**client_kwargs)
+            _CLIENT_CACHE[cache_key] = client
+        return client
+
+
+def get_llm_cache() -> LLMCache | None:
+    """
+    Return the shared response cache, or None if LLM_CACHE_PATH is not set.
+
+    The cache is opened on first use and closed when the process exits.
+    """
+    global _LLM_CACHE
+    cache_path = os.getenv("LLM_CACHE_PATH")
+    if not cache_path:
+        return None
+    with _LLM_CACHE_LOCK:
+        if _LLM_CACHE is None:
+            _LLM_CACHE = LLMCache(cache_path)
+            atexit.register(_LLM_CACHE.close)
+        return _LLM_CACHE
+
+
+def create_or_get_cached_content(
+    client: genai.Client,
+    model_name: str,
+    system_prompt: str
+) -> str | None:
+    """
+    Return the name of a context cache holding system_prompt, creating it once.
+
+    Calls that reference the cache are billed for the prompt at the cached-token
+    rate instead of resending it. Caches are recreated shortly before their TTL
+    runs out, and deleted when the process exits so they don't keep billing
+    storage. Returns None if the cache can't be created (e.g. the prompt is
+    below the model's minimum cacheable size); callers then send it inline.
+    """
+    key = (model_name, system_prompt)
+    with _CONTEXT_CACHES_LOCK:
+        cached = _CONTEXT_CACHES.get(key)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+
+        cache_name = None
+        try:
+            prompt_tokens = client.models.count_tokens(model=model_name, contents=system_prompt).total_tokens
+            if prompt_tokens is not None and prompt_tokens < CONTEXT_CACHE_MIN_TOKENS:
+                # Too small to cache; remember that so it isn't checked on every call
+                _CONTEXT_CACHES[key] = (None, float("inf"))
+                return None
+            cached_content = client.caches.create(
+                model=model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt,
+                    ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s",
+                ),
+            )
+            cache_name = cached_content.name
+            atexit.register(_delete_context_cache, client, cache_name)
+        except errors.APIError as e:
+            print(f"Warning: could not create context cache, sending system prompt inline: {e}")
+
+        # Refresh a minute early so requests never reference an expired cache
+        _CONTEXT_CACHES[key] = (cache_name, time.monotonic() + CONTEXT_CACHE_TTL_SECONDS - 60)
+        return cache_name
+
+
+def _delete_context_cache(client: genai.Client, cache_name: str) -> None:
+    """Delete a context cache created by this process (registered with atexit)."""
+    try:
+        client.caches.delete(name=cache_name)
+    except errors.APIError as e:
+        print(f"Warning: could not delete context cache {cache_name}: {e}")
 
 
 def _build_thinking_config(model_name: str) -> types.ThinkingConfig | None:
@@ -43,16 +155,93 @@ def _build_thinking_config(model_name: str) -> types.ThinkingConfig | None:
     return None
 
 
+def _max_output_tokens(
+    model_name: str,
+    max_chars: int,
+    thinking_config: types.ThinkingConfig | None
+) -> int | None:
+    """
+    Server-side token cap matching the client-side max_chars limit.
+
+    The estimate is deliberately generous so max_chars stays the binding limit;
+    the cap only stops the server from generating far past it. Returns None
+    (no cap) for thinking models without a thinking config: their dynamic
+    thinking is unbounded and could use up any fixed headroom, leaving no text.
+    """
+    max_tokens = max(16, max_chars // CHARS_PER_TOKEN_ESTIMATE)
+    # Thinking tokens count against max_output_tokens on these models
+    if model_name.strip().startswith(("gemini-2.5", "gemini-3")):
+        if thinking_config is None:
+            return None
+        max_tokens += THINKING_TOKEN_HEADROOM
+    return max_tokens
+
+
+def _chunk_finish_reason(chunk: Any) -> types.FinishReason | None:
+    """Return the finish reason of a stream chunk, if it has one."""
+    candidates = getattr(chunk, "candidates", None)
+    if candidates:
+        return candidates[0].finish_reason
+    return None
+
+
+def _warn_if_out_of_tokens(finish_reason: types.FinishReason | None, text: str, model_name: str) -> bool:
+    """
+    Warn when the token cap was reached before any text was produced.
+
+    Returns:
+        True if the response is empty because of max_output_tokens
+    """
+    if finish_reason == types.FinishReason.MAX_TOKENS and not text.strip():
+        print(
+            f"Warning: {model_name} reached max_output_tokens before producing any text; "
+            "thinking probably used the whole budget"
+        )
+        return True
+    return False
+
+
+def _build_generate_config(
+    model_name: str,
+    system_prompt: str,
+    temperature: float,
+    max_chars: int,
+    cached_content: str | None = None
+) -> types.GenerateContentConfig:
+    """
+    Build the generation config shared by all generate_* helpers.
+
+    When cached_content names a context cache, the system prompt is taken from
+    it and not sent again.
+    """
+    thinking_config = _build_thinking_config(model_name)
+    config_kwargs: dict[str, Any] = {"temperature": temperature}
+    max_output_tokens = _max_output_tokens(model_name, max_chars, thinking_config)
+    if max_output_tokens is not None:
+        config_kwargs["max_output_tokens"] = max_output_tokens
+    if cached_content is not None:
+        config_kwargs["cached_content"] = cached_content
+    else:
+        config_kwargs["system_instruction"] = system_prompt
+    if thinking_config is not None:
+        config_kwargs["thinking_config"] = thinking_config
+    return types.GenerateContentConfig(**config_kwargs)
+
+
 def generate_content(
     client: genai.Client,
     content: types.Part | str,
     model_name: str,
     system_prompt: str,
     temperature: float = 0.0,
-    max_chars: int = 200
+    max_chars: int = 200,
+    use_context_cache: bool = False
 ) -> str:
     """
     Generate content using Gemini API with streaming to prevent excessive token costs.
+
+    With temperature 0.0 the response is deterministic, so when LLM_CACHE_PATH
+    is set an identical earlier request is answered from the on-disk cache.
     
     Args:
         client: Initialized Gemini client
@@ -61,31 +250,50 @@ def generate_content(
         system_prompt: System instruction prompt
         temperature: Temperature for generation (default: 0.0)
         max_chars: Maximum characters to accumulate before breaking
+        use_context_cache: Reference the system prompt from a server-side
+            context cache instead of resending it (see create_or_get_cached_content)
         
     Returns:
         Response text from the API (may be truncated if max_chars exceeded)
     """
-    config_kwargs: dict[str, Any] = {
-        "temperature": temperature,
-        "system_instruction": system_prompt,
-    }
-    thinking_config = _build_thinking_config(model_name)
-    if thinking_config is not None:
-        config_kwargs["thinking_config"] = thinking_config
+    llm_cache = get_llm_cache() if temperature == 0.0 else None
+    if llm_cache is not None:
+        cache_key = make_cache_key(model_name, system_prompt, temperature, max_chars, content)
+        cached_text = llm_cache.get(cache_key)
+        if cached_text is not None:
+            return cached_text
 
+    cached_content = (
+        create_or_get_cached_content(client, model_name, system_prompt)
+        if use_context_cache else None
+    )
     response_stream = client.models.generate_content_stream(
         model=model_name,
         contents=[content],
-        config=types.GenerateContentConfig(**config_kwargs),
+        config=_build_generate_config(model_name, system_prompt, temperature, max_chars, cached_content),
     )
     
-    collected_text = ""
-    for chunk in response_stream:
-        if chunk.text:
-            collected_text += chunk.text
-            # Break if we exceed the character limit to avoid excessive token costs
-            if len(collected_text) > max_chars:
-                break
+    text_parts: list[str] = []
+    total_chars = 0
+    finish_reason = None
+    # Closing the stream on break releases the HTTP response right away
+    # instead of leaving the server generation and connection running
+    with contextlib.closing(response_stream):
+        for chunk in response_stream:
+            finish_reason = _chunk_finish_reason(chunk) or finish_reason
+            chunk_text = chunk.text
+            if chunk_text:
+                text_parts.append(chunk_text)
+                total_chars += len(chunk_text)
+                # Break if we exceed the character limit to avoid excessive token costs
+                if total_chars > max_chars:
+                    break
+    collected_text = "".join(text_parts)
+    out_of_tokens = _warn_if_out_of_tokens(finish_reason, collected_text, model_name)
+
+    # Don't cache an empty response caused by the token cap
+    if llm_cache is not None and not out_of_tokens:
+        llm_cache.set(cache_key, collected_text)
     
     return collected_text
 
@@ -114,44 +322,156 @@ def generate_content_with_stream_capture(
             - full_text_received: all text received before stopping stream
             - was_truncated: True if stream was cut after max_chars
             - max_chars: configured max char limit
+            - finish_reason: finish reason of the last chunk that had one
+              (e.g. "STOP", "MAX_TOKENS"), or None
             - chunks: serialized stream chunks received
     """
-    config_kwargs: dict[str, Any] = {
-        "temperature": temperature,
-        "system_instruction": system_prompt,
+    response_stream = client.models.generate_content_stream(
+        model=model_name,
+        contents=[content],
+        config=_build_generate_config(model_name, system_prompt, temperature, max_chars),
+    )
+
+    text_parts: list[str] = []
+    total_chars = 0
+    chunks: list[dict] = []
+    was_truncated = False
+    finish_reason = None
+
+    with contextlib.closing(response_stream):
+        for chunk in response_stream:
+            chunks.append(_serialize_chunk(chunk))
+            finish_reason = _chunk_finish_reason(chunk) or finish_reason
+            chunk_text = chunk.text
+            if chunk_text:
+                text_parts.append(chunk_text)
+                total_chars += len(chunk_text)
+                if total_chars > max_chars:
+                    was_truncated = True
+                    break
+
+    full_text_received = "".join(text_parts)
+    _warn_if_out_of_tokens(finish_reason, full_text_received, model_name)
+    transcript_text = full_text_received[:max_chars] if was_truncated else full_text_received
+    return {
+        "transcript_text": transcript_text,
+        "full_text_received": full_text_received,
+        "was_truncated": was_truncated,
+        "max_chars": max_chars,
+        "finish_reason": finish_reason.value if finish_reason is not None else None,
+        "chunks": chunks
     }
-    thinking_config = _build_thinking_config(model_name)
-    if thinking_config is not None:
-        config_kwargs["thinking_config"] = thinking_config
 
-    response_stream = client.models.generate_content_stream(
+
+async def agenerate_content_with_stream_capture(
+    client: genai.Client,
+    content: types.Part | str,
+    model_name: str,
+    system_prompt: str,
+    temperature: float = 0.0,
+    max_chars: int = 200
+) -> dict:
+    """
+    Async version of generate_content_with_stream_capture using client.aio.
+
+    Returns the same dictionary as generate_content_with_stream_capture.
+    """
+    response_stream = await client.aio.models.generate_content_stream(
         model=model_name,
         contents=[content],
-        config=types.GenerateContentConfig(**config_kwargs),
+        config=_build_generate_config(model_name, system_prompt, temperature, max_chars),
     )
 
-    full_text_received = ""
+    text_parts: list[str] = []
+    total_chars = 0
     chunks: list[dict] = []
     was_truncated = False
+    finish_reason = None
 
-    for chunk in response_stream:
-        chunks.append(_serialize_chunk(chunk))
-        if chunk.text:
-            full_text_received += chunk.text
-            if len(full_text_received) > max_chars:
-                was_truncated = True
-                break
+    async with contextlib.aclosing(response_stream):
+        async for chunk in response_stream:
+            chunks.append(_serialize_chunk(chunk))
+            finish_reason = _chunk_finish_reason(chunk) or finish_reason
+            chunk_text = chunk.text
+            if chunk_text:
+                text_parts.append(chunk_text)
+                total_chars += len(chunk_text)
+                if total_chars > max_chars:
+                    was_truncated = True
+                    break
 
+    full_text_received = "".join(text_parts)
+    _warn_if_out_of_tokens(finish_reason, full_text_received, model_name)
     transcript_text = full_text_received[:max_chars] if was_truncated else full_text_received
     return {
         "transcript_text": transcript_text,
         "full_text_received": full_text_received,
         "was_truncated": was_truncated,
         "max_chars": max_chars,
+        "finish_reason": finish_reason.value if finish_reason is not None else None,
         "chunks": chunks
     }
 
 
+async def transcribe_batch(
+    client: genai.Client,
+    image_files: list[Path],
+    model_name: str,
+    system_prompt: str,
+    temperature: float = 0.0,
+    max_chars: int = 200,
+    max_concurrency: int = 8,
+    on_result: Callable[[int, dict | Exception], None] | None = None
+) -> list[dict | Exception]:
+    """
+    Transcribe many images concurrently, at most max_concurrency at a time.
+    
+    Each image is read only once its request is about to start, so at most
+    max_concurrency images are held in memory.
+    
+    Args:
+        client: Initialized Gemini client
+        image_files: Paths of the image files to transcribe
+        model_name: Name of the Gemini model to use
+        system_prompt: System instruction prompt
+        temperature: Temperature for generation (default: 0.0)
+        max_chars: Maximum characters to accumulate before breaking (default: 200)
+        max_concurrency: Maximum number of requests in flight
+        on_result: Called with (index, result) as soon as each image finishes,
+            so callers can save results before the rest of the batch is done
+        
+    Returns:
+        One result per image, in input order: the stream capture dictionary
+        (see generate_content_with_stream_capture), or the exception raised
+        for that image (including read errors) so one failure doesn't abort
+        the whole batch.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def transcribe_one(index: int, image_file: Path) -> dict | Exception:
+        async with semaphore:
+            try:
+                image_part = await asyncio.to_thread(load_image_as_part, image_file)
+                result = await agenerate_content_with_stream_capture(
+                    client=client,
+                    content=image_part,
+                    model_name=model_name,
+                    system_prompt=system_prompt,
+                    temperature=temperature,
+                    max_chars=max_chars
+                )
+            except Exception as e:
+                result = e
+            if on_result is not None:
+                on_result(index, result)
+            return result
+
+    return await asyncio.gather(
+        *(transcribe_one(index, image_file) for index, image_file in enumerate(image_files)),
+        return_exceptions=True
+    )
+
+
 def generate_transcription(
     client: genai.Client,
     image_part: types.Part,
@@ -211,7 +531,9 @@ def generate_consolidation(
     model_name: str,
     system_prompt: str,
     temperature: float = 0.0,
-    max_chars: int = 200
+    max_chars: int = 200,
+    use_context_cache: bool = False,
+    semantic_cache: SemanticCache | None = None
 ) -> str:
     """
     Generate consolidation for concatenated transcripts using Gemini API.
@@ -223,16 +545,32 @@ def generate_consolidation(
         system_prompt: System instruction prompt
         temperature: Temperature for generation (default: 0.0)
         max_chars: Maximum characters to accumulate before breaking (default: 200)
+        use_context_cache: Reuse the system prompt from a server-side context
+            cache across calls instead of resending it (default: False)
+        semantic_cache: Optional cache that returns the stored response for a
+            near-duplicate text_content instead of calling the model
         
     Returns:
         Response text from the API (may be truncated if max_chars exceeded)
     """
-    return generate_content(
+    if semantic_cache is not None:
+        context_key = make_cache_key(model_name, system_prompt, temperature, max_chars, "")
+        vector = semantic_cache.embed(text_content)
+        cached_response = semantic_cache.lookup(context_key, vector)
+        if cached_response is not None:
+            return cached_response
+
+    response_text = generate_content(
         client=client,
         content=text_content,
         model_name=model_name,
         system_prompt=system_prompt,
         temperature=temperature,
-        max_chars=max_chars
+        max_chars=max_chars,
+        use_context_cache=use_context_cache
     )
 
+    if semantic_cache is not None:
+        semantic_cache.add(context_key, text_content, vector, response_text)
+    return response_text
+
@@ -0,0 +1,86 @@
+"""Helper functions for HTTP requests: pooled sessions, rate limiting and token buckets."""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces out calls to at most `rate` per second.
+
+    Worker threads call acquire() before each request; calls are spread evenly
+    so the long-term request rate stays at the configured value.
+    """
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until the caller is allowed to make the next request."""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: bursts of up to `capacity` calls, `rate` per second on average.
+
+    Unlike RateLimiter, idle time is saved up as tokens, so a burst of requests
+    after a pause goes out immediately while the long-term rate stays capped.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: float = 1) -> None:
+        """Take n tokens, blocking until they have been refilled if necessary."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            # Going below zero reserves tokens that later callers have to wait for,
+            # so the sleep can happen outside the lock
+            self._tokens -= n
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def create_session(
+    pool_connections: int = 10,
+    pool_maxsize: int = 10,
+    max_retries: Retry | int = 0
+) -> requests.Session:
+    """
+    Create a requests session that reuses TCP+TLS connections across calls.
+
+    Args:
+        pool_connections: Number of per-host connection pools to cache
+        pool_maxsize: Maximum number of connections kept per host
+        max_retries: urllib3 Retry policy (or retry count) for failed requests
+
+    Returns:
+        Session with a pooled HTTPAdapter mounted for http and https
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=max_retries
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
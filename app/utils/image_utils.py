@@ -1,12 +1,16 @@
 """Helper functions for image file handling."""
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import io
+import os
 import PIL.Image
 from google.genai import types
 
 
 # Supported image extensions
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+# Same without the dot, for matching the text after the last "." in a file name
+_IMAGE_EXTENSIONS_NO_DOT = frozenset(ext[1:] for ext in IMAGE_EXTENSIONS)
 
 # MIME type mapping
 MIME_TYPE_MAP = {
@@ -30,6 +34,13 @@ def get_subfolders(folder_path: str) -> list[Path]:
     return [f for f in folder.iterdir() if f.is_dir()]
 
 
+def _has_image_extension(name: str) -> bool:
+    """Check a file name against IMAGE_EXTENSIONS, as Path(name).suffix.lower() would."""
+    stem, dot, extension = name.rpartition('.')
+    # A name like ".jpg" is a hidden file without an extension
+    return bool(stem) and extension.lower() in _IMAGE_EXTENSIONS_NO_DOT
+
+
 def get_image_files_from_folder(folder_path: str) -> list[Path]:
     """
     Get all image files from a folder.
@@ -51,10 +62,13 @@ def get_image_files_from_folder(folder_path: str) -> list[Path]:
     if not folder.is_dir():
         raise ValueError(f"'{folder_path}' is not a directory")
     
-    image_files = [
-        f for f in folder.iterdir()
-        if f.suffix.lower() in IMAGE_EXTENSIONS
-    ]
+    # scandir gives names and file types without a Path object or stat per entry;
+    # Path objects are created only for the matching files
+    with os.scandir(folder) as entries:
+        image_files = [
+            Path(entry.path) for entry in entries
+            if _has_image_extension(entry.name) and entry.is_file()
+        ]
     
     if not image_files:
         raise ValueError(f"No image files found in '{folder_path}'")
@@ -62,25 +76,36 @@ def get_image_files_from_folder(folder_path: str) -> list[Path]:
     return sorted(image_files)
 
 
+def _get_image_files_or_error(folder_path: str) -> list[Path] | Exception:
+    """Like get_image_files_from_folder, but return a missing/empty folder error instead of raising."""
+    try:
+        return get_image_files_from_folder(folder_path)
+    except (FileNotFoundError, ValueError) as e:
+        return e
+
+
 def collect_image_files_from_folders(folder_names: list[str]) -> list[Path]:
     """
     Collect all image files from multiple folders.
     
+    Folders are listed concurrently, since directory reads are I/O-bound.
+    
     Args:
         folder_names: List of folder paths to search for images
         
     Returns:
         List of Path objects for all image files found across all folders
     """
+    with ThreadPoolExecutor(max_workers=max(1, min(32, len(folder_names)))) as executor:
+        results = list(executor.map(_get_image_files_or_error, folder_names))
+
     all_image_files = []
-    for folder_name in folder_names:
-        try:
-            image_files = get_image_files_from_folder(folder_name)
-            all_image_files.extend(image_files)
-            print(f"Found {len(image_files)} image(s) in '{folder_name}'")
-        except (FileNotFoundError, ValueError) as e:
-            print(f"Warning: {e}")
+    for folder_name, result in zip(folder_names, results):
+        if isinstance(result, Exception):
+            print(f"Warning: {result}")
             continue
+        all_image_files.extend(result)
+        print(f"Found {len(result)} image(s) in '{folder_name}'")
     return all_image_files
 
 
@@ -94,7 +119,13 @@ def load_image_as_part(image_file: Path) -> types.Part:
     Returns:
         Part object containing the image data and MIME type
     """
-    # Load the image
+    # Supported formats are sent as-is; decoding and re-encoding them with PIL
+    # would only cost CPU and memory
+    mime_type = MIME_TYPE_MAP.get(image_file.suffix.lower())
+    if mime_type is not None:
+        return types.Part.from_bytes(data=image_file.read_bytes(), mime_type=mime_type)
+
+    # Unknown extension: let PIL detect the format and re-encode the image
     image = PIL.Image.open(image_file)
     
     # Convert PIL Image to bytes
@@ -103,9 +134,5 @@ def load_image_as_part(image_file: Path) -> types.Part:
     img_bytes.seek(0)
     image_bytes = img_bytes.read()
     
-    # Determine MIME type based on file extension
-    mime_type = MIME_TYPE_MAP.get(image_file.suffix.lower(), 'image/jpeg')
-    
     # Create and return image part
-    return types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
-
+    return types.Part.from_bytes(data=image_bytes, mime_type='image/jpeg')
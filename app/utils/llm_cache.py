@@ -0,0 +1,86 @@
+"""Exact-match on-disk cache for deterministic LLM responses."""
+import hashlib
+import json
+import shelve
+import threading
+from typing import Any
+
+
+def make_cache_key(
+    model_name: str,
+    system_prompt: str,
+    temperature: float,
+    max_chars: int,
+    content: Any
+) -> str:
+    """
+    Build a SHA-256 cache key from everything that determines the response.
+
+    Args:
+        model_name: Name of the Gemini model
+        system_prompt: System instruction prompt
+        temperature: Temperature setting
+        max_chars: Character limit the response was truncated to
+        content: Content sent to the model (str, or Part with inline image data)
+
+    Returns:
+        Hex digest string
+    """
+    if isinstance(content, str):
+        content_key = content
+    else:
+        # Hash image bytes separately so the key payload stays small
+        inline_data = content.inline_data
+        content_key = {
+            "mime_type": inline_data.mime_type,
+            "sha256": hashlib.sha256(inline_data.data).hexdigest()
+        }
+
+    payload = json.dumps(
+        {
+            "model": model_name,
+            "sys": system_prompt,
+            "temp": temperature,
+            "max_chars": max_chars,
+            "content": content_key
+        },
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Shelve-backed response cache with hit/miss counters.
+
+    Safe to share between threads; shelve itself is not, so access is locked.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._db = shelve.open(path)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        """Return the cached response for key, or None on a miss."""
+        with self._lock:
+            value = self._db.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response and flush it to disk."""
+        with self._lock:
+            self._db[key] = value
+            self._db.sync()
+
+    def close(self) -> None:
+        """Close the underlying shelve file."""
+        with self._lock:
+            self._db.close()
@@ -2,14 +2,50 @@
 Retrieval-augmented generation (RAG) utilities.
 '''
 from pathlib import Path
+import functools
 import json
 import re
 
+# orjson parses several times faster; fall back to the standard library
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+
+# Alphanumeric sequences of 4+ characters (includes Latin letters with diacritics).
+# [^\W_] matches Unicode word characters (letters, digits) except underscore
+_WORD_RE = re.compile(r'[^\W_]{4,}', re.UNICODE)
+# Words that appear in almost every transcript and carry no useful context
+_EXCLUDE_WORDS = frozenset(("loan", "transcript", "zool"))
+
+# Static part of the RAG context, appended after the specimen-specific lines
+_RAG_TAIL = """
+- The specimen was probably collected in 1900s. Year might be abbreviated as YY, or written as YYYY.
+- The labels may be in any language using the Latin alphabet with diacritics.
+- The labels often contain the following types of information, but **capture all legible content even if it does not fit these categories**:
+  - **Locality names:** country, region, abbreviation, coordinates.
+  - **Collection Data:** dates (months often in Roman numerals), and collector names (sometimes with 'leg' or 'coll').
+  - **Taxonomy:** binomial scientific names, author names, and determiner names (sometimes with 'det').
+  - **Curatorial:** loan info, catalog numbers, type status.
+"""
+
+@functools.lru_cache(maxsize=512)
+def _load_meta_cached(meta_path: str, mtime_ns: int) -> dict:
+    """Parse meta.json; mtime_ns is part of the cache key so edited files are re-read."""
+    try:
+        return json_loads(Path(meta_path).read_bytes())
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    except (json.JSONDecodeError, IOError):
+        return {}
+
 
 def load_meta_json(folder_path: str | Path) -> dict:
     """
     Load meta.json from the specified folder if it exists.
     
+    Parsed files are cached by path and modification time.
+    
     Args:
         folder_path: Path to the image folder.
     
@@ -17,14 +53,13 @@ def load_meta_json(folder_path: str | Path) -> dict:
         Dictionary with metadata, or empty dict if file doesn't exist or can't be read.
     """
     meta_path = Path(folder_path) / "meta.json"
-    if not meta_path.exists():
-        return {}
-    
     try:
-        with open(meta_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
+        mtime_ns = meta_path.stat().st_mtime_ns
+    except OSError:
         return {}
+    
+    # Copy so callers can't modify the cached dict
+    return dict(_load_meta_cached(str(meta_path.resolve()), mtime_ns))
 
 
 def get_distinct_words(transcripts_content: str) -> list[str]:
@@ -40,19 +75,25 @@ def get_distinct_words(transcripts_content: str) -> list[str]:
     Returns:
         List of distinct words (lowercase, sorted).
     """
-    if not transcripts_content:
-        return []
-    
-    exclude_words = ["loan", "transcript", "zool"]
+    return _scan_transcripts(transcripts_content)[0]
+
 
-    # Match alphanumeric sequences of 4+ characters (includes Latin letters with diacritics)
-    # [^\W_] matches Unicode word characters (letters, digits) except underscore
-    words = re.findall(r'[^\W_]{4,}', transcripts_content, re.UNICODE)
+def _scan_transcripts(transcripts_content: str) -> tuple[list[str], bool]:
+    """
+    Lowercase the transcripts once and extract everything get_rag_content needs.
+    
+    Returns:
+        Tuple of (distinct words as in get_distinct_words, whether the text
+        mentions a loan number, i.e. "Loan No." in any letter case).
+    """
+    if not transcripts_content:
+        return [], False
     
-    # Convert to lowercase and get distinct words
-    distinct_words = sorted(set(word.lower() for word in words if word.lower() not in exclude_words))
+    # Lowercase the whole text once instead of every matched word
+    lowered = transcripts_content.lower()
+    words = _WORD_RE.findall(lowered)
     
-    return distinct_words
+    return sorted({word for word in words if word not in _EXCLUDE_WORDS}), "loan no." in lowered
 
 
 def get_rag_content(folder_path: str | Path = None, transcripts_content: str = None) -> str:
@@ -68,43 +109,33 @@ def get_rag_content(folder_path: str | Path = None, transcripts_content: str = N
         RAG context string with metadata if available.
     """
 
-    distinct_words = get_distinct_words(transcripts_content)
+    distinct_words, has_loan_number = _scan_transcripts(transcripts_content)
     print("DEBUG: ", distinct_words)
 
     metadata = load_meta_json(folder_path) if folder_path else {}
-    context = "# Context:\n"
+    parts = ["# Context:\n"]
     
     # Build metadata context string
-    meta_context = ""
     if metadata:
         if "country" in metadata:
             if metadata["country"] != "world":
-                context += f"\n- The specimen has been collected in {metadata['country']}."
+                parts.append(f"\n- The specimen has been collected in {metadata['country']}.")
             else:
-                context += f"\n- The specimen could have been collected anywhere in the world."
+                parts.append("\n- The specimen could have been collected anywhere in the world.")
         else:
-            context += f"\n- The specimen could have been collected anywhere in the world."
+            parts.append("\n- The specimen could have been collected anywhere in the world.")
 
-        context += "\n- The specimen belongs to "
+        parts.append("\n- The specimen belongs to ")
         if "class" in metadata:
-            context += f"class {metadata['class']} "
+            parts.append(f"class {metadata['class']} ")
         if "order" in metadata:
-            context += f"order {metadata['order']} "
+            parts.append(f"order {metadata['order']} ")
         if "species" in metadata:
-            context += f"species {metadata['species']}"
-        context += "."
+            parts.append(f"species {metadata['species']}")
+        parts.append(".")
 
-    if "Loan No." in transcripts_content:
-        context += "\n- The specimen contains a single loan number, with format 'Mus. Zool. Helsinki Loan No. HE <integer>'."
+    if has_loan_number:
+        parts.append("\n- The specimen contains a single loan number, with format 'Mus. Zool. Helsinki Loan No. HE <integer>'.")
 
-    content = context + f"""
-- The specimen was probably collected in 1900s. Year might be abbreviated as YY, or written as YYYY.
-- The labels may be in any language using the Latin alphabet with diacritics.
-- The labels often contain the following types of information, but **capture all legible content even if it does not fit these categories**:
-  - **Locality names:** country, region, abbreviation, coordinates.
-  - **Collection Data:** dates (months often in Roman numerals), and collector names (sometimes with 'leg' or 'coll').
-  - **Taxonomy:** binomial scientific names, author names, and determiner names (sometimes with 'det').
-  - **Curatorial:** loan info, catalog numbers, type status.
-"""
-    
-    return content
\ No newline at end of file
+    parts.append(_RAG_TAIL)
+    return "".join(parts)
@@ -0,0 +1,89 @@
+"""In-memory semantic cache: reuse LLM responses for near-duplicate inputs."""
+import math
+import threading
+from collections import OrderedDict
+
+import google.genai as genai
+
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-004"
+
+
+def _normalize(vector: list[float]) -> list[float]:
+    """Scale vector to unit length so a dot product gives cosine similarity."""
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        return vector
+    return [v / norm for v in vector]
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour response cache keyed by text embeddings.
+
+    Entries are grouped by a context key (model, system prompt, settings) so a
+    response is only reused for the same kind of call. The least recently used
+    entry is evicted once max_entries is reached.
+
+    Note: a hit returns the response for a *different* input text. Keep the
+    threshold high; specimens that differ only in a date or number can still
+    score above it.
+    """
+
+    def __init__(
+        self,
+        client: genai.Client,
+        threshold: float = 0.97,
+        max_entries: int = 1000,
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL
+    ):
+        self.client = client
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embedding_model = embedding_model
+        self.hits = 0
+        self.misses = 0
+        # (context_key, text) -> (unit vector, response), oldest first
+        self._entries: OrderedDict[tuple[str, str], tuple[list[float], str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> list[float]:
+        """Return the unit-length embedding of text."""
+        result = self.client.models.embed_content(model=self.embedding_model, contents=text)
+        return _normalize(list(result.embeddings[0].values))
+
+    def lookup(self, context_key: str, vector: list[float]) -> str | None:
+        """
+        Return the response of the most similar cached input, if similar enough.
+
+        Args:
+            context_key: Key identifying the model/prompt/settings of the call
+            vector: Unit-length embedding of the input text
+
+        Returns:
+            Cached response, or None if no entry reaches the threshold
+        """
+        with self._lock:
+            best_key = None
+            best_score = self.threshold
+            for key, (cached_vector, _) in self._entries.items():
+                if key[0] != context_key:
+                    continue
+                score = sum(a * b for a, b in zip(vector, cached_vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][1]
+
+    def add(self, context_key: str, text: str, vector: list[float], response: str) -> None:
+        """Store a response, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[(context_key, text)] = (vector, response)
+            self._entries.move_to_end((context_key, text))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)